@@ -7,20 +7,22 @@ Definition of a function to get raster values within buffers<br>
 """
 
 import numpy as np
-import rasterio
-from rasterio.mask import mask
 import geopandas as gpd
-from shapely.geometry import mapping
 from shapely.geometry import Point
 
+from modules.fingerprint import file_fingerprint, geometry_fingerprint
+from modules.value_cache import lookup_values, store_values
+from modules.zonal_statistics import zonal_statistics, zonal_statistics_radii, weighted_zonal_statistics
 
-def average_raster_values(working_dir, raster_data, result_name, traindata):
+
+def average_raster_values(working_dir, raster_data, result_name, traindata, cache_dir=None, max_cache_entries=1000000, radius=None, radii=None, statistic='mean', write_intermediates=False):
     """Get raster values within buffers
     
-    This script calculates the average or median of all values of pixels from a raster
-    within the buffered archeological site. Multiple Rasters are processed. The 
-    result is a shapefile of the buffered sites with a column for the average 
-    values for each raster (predictor variable).
+    This script calculates the average or another statistic of all values of
+    pixels from a raster within the buffered archeological site. Multiple rasters
+    are processed. The result is a table (GeoDataFrame) of the sites with a column
+    for the average values of each raster (predictor variable). It is only saved
+    as shapefile if write_intermediates is True.
 
     Parameters
     ----------
@@ -31,12 +33,43 @@ def average_raster_values(working_dir, raster_data, result_name, traindata):
     result_name: str
         Name of the model
     traindata: GeoDataFrame
-        Subset of buffered sites
+        Subset of buffered sites, or of site points if radius is set
+    cache_dir: str
+        Directory of the persistent value cache. If it is set, values already
+        extracted for a raster and a buffer in earlier runs are taken from the cache
+        and only the missing ones are extracted (default None: no cache)
+    max_cache_entries: int
+        Maximum number of values kept in the cache
+    radius: str or float
+        Radius of the circles in map units, half of the buffer size (which is a
+        diameter). If it is set, traindata contains the site points and the values
+        are averaged within circles around them, so no shapefile of buffered sites
+        is needed (default None: traindata contains the buffers)
+    radii: list
+        Radii of the circles of all buffer sizes of the current run. Together with
+        the cache the values of all of them are calculated in the same pass over
+        the raster, so later models with another buffer size take their values
+        from the cache
+    statistic: str
+        Statistic of the pixel values within a buffer: 'mean' (default) for the
+        average of all touched pixels, or a statistic of weighted_zonal_statistics,
+        where every pixel is weighted by the part of it covered by the buffer:
+        'weighted_mean', 'weighted_median' or 'weighted_p<percentile>', e.g. 'weighted_p25'
+    write_intermediates: bool
+        If True, the table is also saved as shapefile for debugging (default False)
+
+    Returns
+    -------
+    gdf: GeoDataFrame
+        Sites with the coordinates 'x' and 'y' of the buffer centers, one column
+        of average values per raster (NaN if there is no valid pixel within the
+        buffer) and the buffer centers as geometry, with the index of traindata
 
     Note
     ----
     This is the first function called by the run_model.py script as a substep of calculating the predictive model. 
-    The output file is saved as follows.
+    If write_intermediates is True, the output file is saved as follows. Column
+    names of shapefiles are limited to 10 characters.
 
     Type: Shapefile shp
     File location: working_dir + 'tmp/sites_with_rastervalues/'
@@ -45,72 +78,121 @@ def average_raster_values(working_dir, raster_data, result_name, traindata):
 
     # get path to rasterdata
     path_rasters = working_dir + "data/"
-    # generate empty value list for every raster in the (predictor variables) raster dictionary
-    # the list will be filled with calculated values later
-    for raster in raster_data:
-        raster_data[raster]['values'] = []
     # import buffer polygons
     shapefile = traindata 
     # save crs, needed later
     crs = shapefile.crs 
     # make list of buffers as shapely geometries
     g = shapefile.geometry.values
-    # prepare empty lists
-    x_list = []
-    y_list = []
-    value_list = []
+    # x- and y-coordinates of the buffercenters
+    x = [geometry.centroid.x for geometry in g]
+    y = [geometry.centroid.y for geometry in g]
 
     # loop over every raster in raster dictionary
     for raster in raster_data:
         print('Raster: ' + raster)
-        # for every raster loop over every buffer
-        for geometry in g:
-            # transform to GeoJSON format
-            geoms = [mapping(geometry)] 
-            # import raster and extract the raster values within the polygon
-            # include every pixel in the mask that touches the shapes (all_touched = True)
-            with rasterio.open(path_rasters + raster_data[raster]['path']) as src:
-                out_image, out_transform = mask(src, geoms, crop=True, all_touched=True)
-            # extract the values of the masked array
-            data = out_image[0]
-            # no data values of the original raster
-            no_data = src.nodata
-            # extract the valide values
-            value = np.extract(data != no_data, data)
-            # calculate average  of all values within a buffer and append this calculated values to lists
-            _sum = 0
-            count = 0
-            for i in range(0, len(value)):
-                _sum += value[i]
-                count += 1
-            average = _sum / count
-            value_list.append(round(average, 8))
-            # append x- and y-coordinates of the buffercenter to lists
-            x_list.append(geometry.centroid.x)
-            y_list.append(geometry.centroid.y)
-            
+        raster_path = path_rasters + raster_data[raster]['path']
+        if cache_dir is None:
+            averages = _extract_averages(raster_path, g, [radius], statistic)[_options_key(radius, statistic)]
+        else:
+            averages = _cached_averages(raster_path, g, radius, radii, statistic, cache_dir, max_cache_entries)
         # fill raster dictionary with the calculated average values
-        raster_data[raster]['values'] = value_list 
-        x = x_list
-        y = y_list
-        print('Processed '+ str(len(x_list)) + ' buffered sites')
-        # empty lists for next raster
-        value_list = [] 
-        x_list = []
-        y_list = []
+        raster_data[raster]['values'] = list(np.round(averages, 8))
+        print('Processed '+ str(len(x)) + ' buffered sites')
 
     # save coordinates and average values in new GeoDataFrame
-    gdf = gpd.GeoDataFrame({'x': x, 'y': y}) 
+    gdf = gpd.GeoDataFrame({'x': x, 'y': y}, index=shapefile.index)
     for raster in raster_data:
         gdf[raster] = raster_data[raster]['values']
     # add center of buffer (location of archeological site) as geometry
     gdf['geometry'] = gdf.apply(lambda row: Point(row['x'], row['y']), axis=1) 
     # set coordinate reference system
     gdf.crs = crs 
-    # export as shapefile
-    gdf.to_file(working_dir + 'tmp/sites_with_rastervalues/sites_with_rastervalues_' + result_name + '.shp',
-            driver='ESRI Shapefile') 
+    # export as shapefile for debugging
+    if write_intermediates:
+        gdf.to_file(working_dir + 'tmp/sites_with_rastervalues/sites_with_rastervalues_' + result_name + '.shp',
+                driver='ESRI Shapefile')
     print('Calculation of average raster values finished\n')
+    return gdf
 
 
-    
+def _options_key(radius, statistic):
+    """Description of the extraction options, used as key in the cache"""
+
+    if statistic == 'mean':
+        options_key = 'mean;all_touched=True'
+    else:
+        options_key = statistic + ';coverage_weighted'
+    if radius is not None:
+        options_key += ';radius={:g}'.format(float(radius))
+    return options_key
+
+
+def _extract_averages(raster_path, geometries, radii, statistic):
+    """Average raster values within every buffer, for every radius if the geometries are points
+
+    The radii are the radii of the circles (half of the buffer sizes), converted
+    once in process.py for the mean and the weighted statistics alike.
+    """
+
+    if statistic != 'mean':
+        # weight the pixels by their coverage, around points the buffers are made here
+        percentiles = []
+        column = statistic
+        if statistic.startswith('weighted_p'):
+            percentiles = [float(statistic[len('weighted_p'):])]
+            column = 'weighted_p{:g}'.format(percentiles[0])
+        elif statistic not in ('weighted_mean', 'weighted_median'):
+            raise ValueError('Unknown zonal statistic: ' + statistic)
+        averages = {}
+        for radius in radii:
+            if radius is None:
+                buffers = geometries
+            else:
+                # the circles have the same radius as those of zonal_statistics_radii, half of the buffer size
+                buffers = [Point(geometry.centroid.x, geometry.centroid.y).buffer(float(radius))
+                           for geometry in geometries]
+            df_weighted_zonal_statistics = weighted_zonal_statistics(raster_path, buffers, percentiles)
+            averages[_options_key(radius, statistic)] = df_weighted_zonal_statistics[column].values
+        return averages
+
+    # include every pixel in the mask that touches the shapes (all_touched = True)
+    if radii == [None]:
+        # open the raster once and calculate the statistics of all buffers together
+        df_zonal_statistics = zonal_statistics(raster_path, geometries, all_touched=True)
+        return {_options_key(None, statistic): df_zonal_statistics['mean'].values}
+    # calculate the statistics of the circles of all radii together
+    zonal_statistics_per_radius = zonal_statistics_radii(raster_path, geometries, radii, all_touched=True)
+    return {_options_key(radius, statistic): df_zonal_statistics['mean'].values
+            for radius, df_zonal_statistics in zonal_statistics_per_radius.items()}
+
+
+def _cached_averages(raster_path, geometries, radius, radii, statistic, cache_dir, max_cache_entries):
+    """Average raster values within every buffer, extracting only the values missing in the cache"""
+
+    # values of all radii are looked up and extracted together
+    if radius is None:
+        radii = [None]
+    else:
+        radii = sorted(set([float(radius)] + [float(other) for other in (radii or [])]))
+    raster_key = file_fingerprint(raster_path, cache_dir)
+    site_keys = [geometry_fingerprint(geometry) for geometry in geometries]
+    cached_values = {}
+    missing = set()
+    for other in radii:
+        options_key = _options_key(other, statistic)
+        cached_values[options_key] = lookup_values(cache_dir, raster_key, site_keys, options_key)
+        missing.update(i for i, key in enumerate(site_keys) if key not in cached_values[options_key])
+    missing = sorted(missing)
+
+    # extract the values of the sites that are not in the cache yet
+    print(str(len(site_keys) - len(missing)) + ' sites taken from cache, ' + str(len(missing)) + ' to extract')
+    if missing:
+        missing_keys = [site_keys[i] for i in missing]
+        missing_averages = _extract_averages(raster_path, [geometries[i] for i in missing], radii, statistic)
+        for options_key, averages in missing_averages.items():
+            store_values(cache_dir, raster_key, missing_keys, options_key, averages, max_cache_entries)
+            cached_values[options_key].update(zip(missing_keys, averages))
+
+    requested_values = cached_values[_options_key(radius, statistic)]
+    return np.array([requested_values[key] for key in site_keys], dtype=float)
@@ -0,0 +1,87 @@
+"""
+fingerprint.py<br>
+python 3.6.7<br>
+Definition of functions that give files and geometries a stable key for caching<br>
+@author: Lisa Stubert<br>
+@date: 2019-05-30<br>
+"""
+
+import hashlib
+import json
+import os
+
+# content hashes already calculated in this session, keyed by path, size and modification time
+_known_fingerprints = {}
+
+
+def file_fingerprint(path, cache_dir=None):
+    """Content hash of a file
+
+    The content of the file is hashed only once per file version. The hash is
+    remembered by path, size and modification time, in memory and, if a cache
+    directory is given, in the file 'fingerprints.json' inside this directory, so
+    later runs do not have to read the file again.
+
+    Parameters
+    ----------
+    path: str
+        Path to the file
+    cache_dir: str
+        Directory to remember the hashes across runs (optional)
+
+    Returns
+    -------
+    fingerprint: str
+        SHA-1 hex digest of the file content
+    """
+
+    path = os.path.abspath(path)
+    status = os.stat(path)
+    version = '{}|{}|{}'.format(path, status.st_size, status.st_mtime_ns)
+    if version in _known_fingerprints:
+        return _known_fingerprints[version]
+
+    # look up hashes of earlier runs
+    memo_path = None
+    memo = {}
+    if cache_dir is not None:
+        memo_path = os.path.join(cache_dir, 'fingerprints.json')
+        if os.path.exists(memo_path):
+            with open(memo_path) as memo_file:
+                memo = json.load(memo_file)
+    if version in memo:
+        _known_fingerprints[version] = memo[version]
+        return memo[version]
+
+    # hash the content in chunks, so large rasters are never loaded completely
+    digest = hashlib.sha1()
+    with open(path, 'rb') as content:
+        for chunk in iter(lambda: content.read(1 << 20), b''):
+            digest.update(chunk)
+    fingerprint = digest.hexdigest()
+    _known_fingerprints[version] = fingerprint
+
+    if memo_path is not None:
+        os.makedirs(cache_dir, exist_ok=True)
+        # drop entries of older versions of the same file
+        memo = {key: value for key, value in memo.items() if not key.startswith(path + '|')}
+        memo[version] = fingerprint
+        with open(memo_path, 'w') as memo_file:
+            json.dump(memo, memo_file)
+    return fingerprint
+
+
+def geometry_fingerprint(geometry):
+    """Hash of a shapely geometry
+
+    Parameters
+    ----------
+    geometry: shapely geometry
+
+    Returns
+    -------
+    fingerprint: str
+        SHA-1 hex digest of the well-known binary representation
+    """
+
+    return hashlib.sha1(geometry.wkb).hexdigest()
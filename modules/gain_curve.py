@@ -0,0 +1,155 @@
+"""
+gain_curve.py<br>
+python 3.6.7<br>
+Definition of functions to calculate the gain curve of a suitability raster with its AUC, ROC AUC and Boyce index<br>
+@author: Lisa Stubert<br>
+@date: 2019-05-30<br>
+"""
+
+import numpy as np
+import pandas as pd
+import rasterio
+
+from modules.memory_budget import chunk_pixels
+from modules.raster_stack import read_window
+from modules.raster_windows import row_windows
+
+
+def gain_curve(raster_path, site_values, inside=None, bins=1000, boyce_window=0.1, memory_budget=None):
+    """Gain, percent area and percent sites above every threshold between 0 and 1, AUC, ROC AUC and Boyce index
+
+    The raster is read once, in bands of rows. The values of the valid pixels
+    (inside of the mask) are counted in a histogram with bins of 1 / bins
+    between 0 and 1 (values outside of it are counted below or above), so the
+    area above every threshold i / bins is exact, e.g. at 0.5 and 0.75. For the
+    ROC AUC the pixels below and equal to every site value are counted in the
+    same pass. The site values are sorted once, so the sites above every
+    threshold are found with one search.
+
+    The AUC is the area under the curve of the share of sites over the share of
+    area above the thresholds. The ROC AUC is the probability that a site has a
+    higher value than a random pixel of the raster (ties count half). The
+    continuous Boyce index (Hirzel et al. 2006) is the Spearman correlation of
+    the ratio of the share of sites and the share of area in a moving window
+    with the value of the window (windows without pixels and repeated ratios are
+    left out).
+
+    Parameters
+    ----------
+    raster_path: str
+        Path to the suitability raster
+    site_values: list
+        Suitability at every site, NaN where there is no value
+    inside: array
+        Boolean array of the grid of the raster, pixels where it is False are not
+        counted (default None: all pixels)
+    bins: int
+        Number of thresholds between 0 and 1 (default 1000)
+    boyce_window: float
+        Width of the moving window of the Boyce index (default 0.1)
+    memory_budget: float
+        Memory budget in MB, the raster is read in bands of rows that fit into it
+        (default None: no budget)
+
+    Returns
+    -------
+    curve: dataframe
+        'suitability_area_>' (the thresholds i / bins), 'gain', 'percent area'
+        and 'percent sites' (all sites, also those without value)
+    metrics: dict
+        'auc', 'roc_auc' and 'boyce', NaN if they are not defined
+    """
+
+    edges = np.arange(bins + 1) / float(bins)
+    site_values = np.asarray(site_values, dtype=float)
+    sites = np.sort(site_values[~np.isnan(site_values)])
+    # histogram: slot k holds the values in (edges[k - 1], edges[k]], the first and last slot the values outside
+    histogram = np.zeros(bins + 2, dtype=np.int64)
+    pixels_below = np.zeros(len(sites), dtype=np.int64)
+    pixels_equal = np.zeros(len(sites), dtype=np.int64)
+
+    # memory per pixel of a band: values read with their mask and validity, their vector, bin and sorted vector
+    max_pixels = chunk_pixels(memory_budget, 4 + 1 + 1 + 8 + 8 + 8)
+    with rasterio.open(raster_path) as src:
+        for window in row_windows(src, max_pixels):
+            values = read_window(src, None, window)
+            valid = ~np.ma.getmaskarray(values) & np.isfinite(np.ma.getdata(values))
+            if inside is not None:
+                valid &= inside[window.row_off:window.row_off + window.height]
+            vector = np.sort(np.ma.getdata(values)[valid].astype(np.float64))
+            histogram += np.bincount(np.searchsorted(edges, vector, side='left'), minlength=bins + 2)
+            below = np.searchsorted(vector, sites, side='left')
+            pixels_below += below
+            pixels_equal += np.searchsorted(vector, sites, side='right') - below
+
+    all_pixels = histogram.sum()
+    # pixels above every edge
+    pixels_above = all_pixels - np.cumsum(histogram)[:bins + 1]
+    sites_above = len(sites) - np.searchsorted(sites, edges, side='right')
+    with np.errstate(invalid='ignore', divide='ignore'):
+        percent_area = pixels_above / float(all_pixels) * 100
+        percent_sites = sites_above / float(len(site_values)) * 100
+        gain = np.where(percent_sites > 0, np.round(1 - percent_area / percent_sites, 5), np.nan)
+    curve = pd.DataFrame({'suitability_area_>': edges[:bins], 'gain': gain[:bins],
+                          'percent area': percent_area[:bins], 'percent sites': percent_sites[:bins]})
+
+    metrics = {'auc': np.nan, 'roc_auc': np.nan, 'boyce': np.nan}
+    if len(sites) > 0 and all_pixels > 0:
+        # share of area and of sites above the thresholds, from the highest threshold down, with (0, 0) and (1, 1)
+        area_share = np.concatenate([[0], pixels_above[::-1] / float(all_pixels), [1]])
+        site_share = np.concatenate([[0], sites_above[::-1] / float(len(sites)), [1]])
+        metrics['auc'] = float(np.sum(np.diff(area_share) * (site_share[1:] + site_share[:-1]) / 2))
+        metrics['roc_auc'] = float((pixels_below.sum() + pixels_equal.sum() / 2.0) / (float(len(sites)) * all_pixels))
+        metrics['boyce'] = _boyce_index(histogram, edges, sites, boyce_window)
+    return curve, metrics
+
+
+def gain_at(curve, thresholds):
+    """Rows of a gain curve at given thresholds
+
+    Parameters
+    ----------
+    curve: dataframe
+        Gain curve returned by gain_curve
+    thresholds: list
+        Thresholds, every one is taken from the nearest threshold of the curve
+
+    Returns
+    -------
+    rows: dataframe
+        One row of the curve per threshold, numbered from 0
+    """
+
+    curve_thresholds = curve['suitability_area_>'].values
+    index = np.clip(np.searchsorted(curve_thresholds, thresholds), 1, len(curve_thresholds) - 1)
+    # the nearer of the two neighbouring thresholds
+    index -= np.asarray(thresholds) - curve_thresholds[index - 1] < curve_thresholds[index] - np.asarray(thresholds)
+    return curve.iloc[index].reset_index(drop=True)
+
+
+def _boyce_index(histogram, edges, sites, window):
+    """Continuous Boyce index from the histogram of the pixels and the sorted site values"""
+
+    bins = len(edges) - 1
+    width = max(1, int(round(window * bins)))
+    # the window is moved in steps of a tenth of its width
+    starts = np.arange(0, bins - width + 1, max(1, width // 10))
+    pixels = np.cumsum(histogram)[:bins + 1]
+    area = (pixels[starts + width] - pixels[starts]) / float(histogram.sum())
+    site_count = np.searchsorted(sites, edges[starts + width], side='right') - \
+        np.searchsorted(sites, edges[starts], side='right')
+    used = area > 0
+    predicted_to_expected = site_count[used] / float(len(sites)) / area[used]
+    middle = (edges[starts] + edges[starts + width])[used] / 2
+    # windows with the same ratio as the window before are dropped, like in ecospat.boyce,
+    # so long ranges without sites do not decide the correlation
+    changed = np.concatenate([[True], np.diff(predicted_to_expected) != 0])
+    predicted_to_expected = predicted_to_expected[changed]
+    middle = middle[changed]
+    if len(middle) < 2:
+        return np.nan
+    # Spearman correlation: Pearson correlation of the ranks (ties get their average rank)
+    ranks = pd.DataFrame({'ratio': predicted_to_expected, 'middle': middle}).rank()
+    if ranks['ratio'].nunique() < 2:
+        return np.nan
+    return float(np.corrcoef(ranks['ratio'], ranks['middle'])[0, 1])
@@ -1,22 +1,19 @@
 """ 
 gain_statistics.py<br>
 python 3.6.7<br>
-Definition of a function to get raster values within buffers<br>
+Definition of a function to calculate the gain statistics of a suitability raster<br>
 @author: Lisa Stubert<br>
 @date: 2019-05-30<br>
 """
 
-import numpy as np
 import rasterio
-from rasterio.mask import mask
-import geopandas as gpd
-from shapely.geometry import mapping
-from shapely.geometry import Point
-from osgeo import gdal
-import pandas as pd
 
+from modules.gain_curve import gain_at, gain_curve
+from modules.resample_mask import cutline_mask
+from modules.site_sampler import sample_sites
 
-def gain(working_dir, result_name, buffer_shapefile):
+
+def gain(working_dir, result_name, buffer_shapefile, mask_path=None, mask_cache_dir=None, memory_budget=None, samples=None, bins=1000):
     """Gain statistics
 
     Parameters
@@ -27,11 +24,26 @@ def gain(working_dir, result_name, buffer_shapefile):
         Name of the model
     buffer_shapefile: geodataframe
         Contains shapefiles of sites
+    mask_path: str
+        Path to a shapefile with the polygons to keep, pixels outside of it are
+        not counted (default None: no mask)
+    mask_cache_dir: str
+        Directory of the cache of rasterized masks (default None: no cache, the mask is rasterized every time)
+    memory_budget: float
+        Memory budget in MB, the raster is read in bands of rows that fit into it
+        (default None: no budget)
+    samples: dataframe
+        Suitability at the sites returned by sample_sites for this result (default
+        None: the sites are sampled here)
+    bins: int
+        Number of thresholds of the gain curve between 0 and 1 (default 1000)
 
     Return
     ------
     gain_df: dataframe
-        Contains calculated gain_values
+        Contains calculated gain_values of the suitability zones 0.0, 0.1, ..., 0.7, 0.75, 0.8, 0.9
+    gain_metrics: dict
+        'curve': gain curve at all thresholds, 'auc', 'roc_auc' and 'boyce' (see gain_curve)
     """
 
     # Set path to rasterdata with suitability results
@@ -40,84 +52,21 @@ def gain(working_dir, result_name, buffer_shapefile):
     # Calculation of rastervalues under buffer
     # import polygons
     shapefile = buffer_shapefile
-    # save crs, needed later
-    crs = shapefile.crs
-    # make list of polygons as shapely geometries
-    g = shapefile.geometry.values
-    x_list = []
-    y_list = []
-    value_list = []
-
-    # for every raster loop over every buffer
-    for geometry in g:  
-        # calculate very small buffer for every site, under which the suitability values will be averaged
-        geoms = Point(geometry.centroid.x, geometry.centroid.y).buffer(5)
-        # transform to GeJSON format
-        geoms = [mapping(geoms)]
-        # import raster and extract the raster values within the polygon
+    # rasterized mask of the grid of the result, taken from the cache
+    inside = None
+    if mask_path is not None:
         with rasterio.open(path_raster) as src:
-            out_image, out_transform = mask(
-                src, geoms, crop=True, all_touched=True)
-        # extract the values of the masked array
-        data = out_image[0]
-        # no data values of the original raster
-        no_data = src.nodata
-        # extract the row, columns of the valid values
-        row, col = np.where(data != no_data)
-        # extract the valid values
-        value = np.extract(data != no_data, data)
-        # calculate average value
-        _sum = 0
-        count = 0
-        for i in range(0, len(value)):
-            _sum += value[i]
-            count += 1
-        average = _sum / count
-        value_list.append(average)
-        x_list.append(geometry.centroid.x)
-        y_list.append(geometry.centroid.y)
-
-    x = x_list
-    y = y_list
+            inside = cutline_mask(mask_path, src.transform, src.width, src.height, src.crs, mask_cache_dir)
+    # average of the pixels that touch a very small buffer (5 m) around every site
+    if samples is None:
+        samples = sample_sites(path_raster, shapefile.geometry.values, 5, mask_path, mask_cache_dir)
+    value_list = list(samples['suitability_value'])
 
-    # save coordinates and average values in new GeoDataFrame
-    gdf = gpd.GeoDataFrame({'x': x, 'y': y, 'suitability_value': value_list
-                            })
-    # add center of buffer (location of archeological site) as geometry
-    gdf['geometry'] = gdf.apply(lambda row: Point(row['x'], row['y']), axis=1)
+    # gain, percent area and percent sites above every threshold, from one pass over the raster
+    curve, gain_metrics = gain_curve(path_raster, value_list, inside, bins, memory_budget=memory_budget)
+    gain_metrics['curve'] = curve
 
-    # calculate percentage of sites in different suitability zones
+    # gain in different suitability zones
     suitability_zone = [0.0, 0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.75, 0.8, 0.9]
-    counter = 0
-    percent_site_list = []
-    for index in suitability_zone:
-        counter = 0
-        for item in value_list:
-            if item > index:
-                counter += 1
-        percent_site_list.append((counter/len(value_list))*100)
-
-    # calculate percentage of area for different suitability zones
-    # load raster
-    driver = gdal.GetDriverByName('GTiff')
-    raster = gdal.Open(path_raster)
-    band = raster.GetRasterBand(1)
-    raster_array = band.ReadAsArray()
-    row, col = raster_array.shape
-    all_pixels = row * col
-    percent_area_list = []
-    for index in suitability_zone:
-        b = raster_array > index
-        count_pixels = len(raster_array[b])
-        percent_area_list.append((count_pixels/all_pixels)*100)
-
-    # calculate gain metrics
-    gain = []
-    for i in range(0,len(suitability_zone)):
-        if percent_site_list[i] > 0:
-            gain.append(round((1 - (percent_area_list[i]/(percent_site_list[i]))),5))
-        else: 
-            gain.append(None)
-    gain_df = pd.DataFrame({'suitability_area_>': suitability_zone,
-                            'gain': gain, 'percent area': percent_area_list, 'percent sites': percent_site_list})
-    return(gain_df)
+    gain_df = gain_at(curve, suitability_zone)
+    return gain_df, gain_metrics
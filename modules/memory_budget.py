@@ -0,0 +1,176 @@
+"""
+memory_budget.py<br>
+python 3.6.7<br>
+Definition of functions to keep the raster processing within a memory budget and to report the memory used<br>
+@author: Lisa Stubert<br>
+@date: 2019-05-30<br>
+"""
+
+import sys
+import tempfile
+import tracemalloc
+
+import numpy as np
+
+# number of pixels of a chunk without a budget, 16 MB of float32
+DEFAULT_CHUNK_PIXELS = 4194304
+# smallest number of pixels of a chunk, smaller chunks make reading too slow
+MINIMUM_CHUNK_PIXELS = 65536
+# bytes of arrays kept in memory between models without a budget, 256 MB
+DEFAULT_CACHE_BYTES = 268435456
+# True while the tracing started by start_memory_report runs
+_started_tracing = False
+
+
+def chunk_pixels(memory_budget, bytes_per_pixel, threads=1):
+    """Number of pixels of a chunk that keeps all threads within the memory budget
+
+    Half of the budget is shared by the chunks of all threads, the other half is
+    left for the results (see accumulator), the arrays kept between models (see
+    cache_bytes) and everything else.
+
+    Parameters
+    ----------
+    memory_budget: float
+        Memory budget in MB (None: no budget)
+    bytes_per_pixel: int
+        Memory needed per pixel of a chunk, including all temporary arrays
+    threads: int
+        Number of chunks processed at the same time (default 1)
+
+    Returns
+    -------
+    pixels: int
+        Between MINIMUM_CHUNK_PIXELS and DEFAULT_CHUNK_PIXELS
+    """
+
+    if memory_budget is None:
+        return DEFAULT_CHUNK_PIXELS
+    pixels = int(memory_budget * 1048576 / 2 / bytes_per_pixel / max(1, threads))
+    return min(DEFAULT_CHUNK_PIXELS, max(MINIMUM_CHUNK_PIXELS, pixels))
+
+
+def cache_bytes(memory_budget):
+    """Number of bytes of arrays that may be kept in memory between models, an eighth of the memory budget
+
+    Parameters
+    ----------
+    memory_budget: float
+        Memory budget in MB (None: no budget)
+
+    Returns
+    -------
+    size: int
+        Bytes, DEFAULT_CACHE_BYTES without a budget
+    """
+
+    if memory_budget is None:
+        return DEFAULT_CACHE_BYTES
+    return int(memory_budget * 1048576 / 8)
+
+
+def accumulator(shape, memory_budget=None, directory=None, fill=np.nan):
+    """Array for results, in float32 and kept on disk if needed to stay within the memory budget
+
+    The results are float64 if they need at most a quarter of the budget (or if
+    there is no budget). Otherwise they are float32, which is safe because the
+    results are saved as float32 rasters anyway (only the last digit of single
+    values can change). If they still need more than a quarter of the budget,
+    the array is a memory map of a temporary file, which is deleted when the array
+    is no longer used.
+
+    Parameters
+    ----------
+    shape: tuple
+    memory_budget: float
+        Memory budget in MB (default None: no budget, always float64 in memory)
+    directory: str
+        Directory of the temporary file (default None: the temporary directory of the system)
+    fill: float
+        Initial value (default NaN)
+
+    Returns
+    -------
+    array: array
+        Array of float64 or float32, or memory map of float32
+    """
+
+    pixels = int(np.prod(shape))
+    if memory_budget is None or pixels * 8 <= memory_budget * 1048576 / 4:
+        return np.full(shape, fill, dtype=np.float64)
+    if pixels * 4 <= memory_budget * 1048576 / 4:
+        return np.full(shape, fill, dtype=np.float32)
+    print('Results of ' + str(round(pixels * 4 / 1048576.0, 1)) + ' MB are kept on disk')
+    array = np.memmap(tempfile.TemporaryFile(dir=directory), dtype=np.float32, mode='w+', shape=shape)
+    array[...] = fill
+    return array
+
+
+def start_memory_report():
+    """Start tracing the memory allocated by Python and NumPy, and reset the peak
+
+    Memory maps are not counted, they are backed by files. If the tracing is
+    started here, memory_report stops it again.
+    """
+
+    global _started_tracing
+    if not tracemalloc.is_tracing():
+        tracemalloc.start()
+        _started_tracing = True
+    elif hasattr(tracemalloc, 'reset_peak'):
+        tracemalloc.reset_peak()
+
+
+def memory_report(label, memory_budget=None):
+    """Print the peak of the Python heap traced since start_memory_report and the peak resident memory of the process
+
+    The traced peak only contains the memory allocated by Python and NumPy. The
+    GDAL block cache, the buffers of GDAL (e.g. for warping and rasterizing) and
+    the pages of memory maps are only part of the resident memory of the process
+    (ru_maxrss). This is the peak since the start of the process, so it can be
+    left over from an earlier model, but it shows whether the budget was
+    exceeded.
+
+    Parameters
+    ----------
+    label: str
+        What was calculated, e.g. the name of the model
+    memory_budget: float
+        Memory budget in MB (default None: no budget)
+
+    Returns
+    -------
+    peak: float
+        Peak of the Python heap in MB, None if the memory is not traced
+    """
+
+    global _started_tracing
+    if not tracemalloc.is_tracing():
+        return None
+    peak = tracemalloc.get_traced_memory()[1] / 1048576.0
+    # the tracing slows down every allocation, so it is stopped if it was started for this report
+    if _started_tracing:
+        tracemalloc.stop()
+        _started_tracing = False
+    text = 'Peak memory of ' + label + ': Python heap ' + str(round(peak, 1)) + ' MB'
+    resident = peak_resident_memory()
+    if resident is not None:
+        text += ', process ' + str(round(resident, 1)) + ' MB (peak since start of the process)'
+    if memory_budget is not None:
+        text += ' (budget ' + str(memory_budget) + ' MB)'
+    print(text)
+    return peak
+
+
+def peak_resident_memory():
+    """Peak resident memory of the process in MB, None where it is not available (e.g. on Windows)"""
+
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    if sys.platform == 'darwin':
+        return peak / 1048576.0
+    return peak / 1024.0
@@ -0,0 +1,202 @@
+"""
+output_rasters.py<br>
+python 3.6.7<br>
+Definition of functions to save result rasters tiled, compressed, as Cloud Optimized GeoTIFF or quantized, and to read them back<br>
+@author: Lisa Stubert<br>
+@date: 2019-05-30<br>
+"""
+
+import os
+
+import numpy as np
+import rasterio
+import rasterio.shutil
+from rasterio.enums import Resampling
+from rasterio.windows import Window
+
+from modules.memory_budget import DEFAULT_CHUNK_PIXELS
+
+# width and height of the tiles of the saved rasters
+BLOCK_SIZE = 256
+# nodata value of float32 results
+FLOAT_NODATA = -9999
+# nodata value of quantized results, the values are encoded in 0 to 65534
+QUANTIZED_NODATA = 65535
+
+
+def creation_options(dtype, compress='deflate'):
+    """Creation options of a tiled and compressed GeoTIFF
+
+    Parameters
+    ----------
+    dtype: str
+        Data type of the raster, e.g. 'float32' or 'uint8'
+    compress: str
+        'deflate', 'zstd', 'lzw' or None for no compression (default 'deflate')
+
+    Returns
+    -------
+    options: dict
+        Options for rasterio.open or rasterio.shutil.copy
+    """
+
+    options = {'tiled': True, 'blockxsize': BLOCK_SIZE, 'blockysize': BLOCK_SIZE}
+    if compress is not None and compress.lower() != 'none':
+        options['compress'] = compress.lower()
+        # differences of neighbouring values compress better than the values
+        options['predictor'] = 3 if np.dtype(dtype).kind == 'f' else 2
+    return options
+
+
+def write_suitability(array, transform, crs, path, compress='deflate', cog=False, quantize=False):
+    """Save suitability values as tiled and compressed GeoTIFF
+
+    The values are float32 with the nodata value -9999. If quantize is set, they
+    are encoded as uint16 between their lowest and highest value, and the scale
+    and offset that turn the codes back into values are saved with the raster
+    (the error is at most half a step of 1/65534 of the range). Readers of the
+    results apply them (see unscale).
+
+    The values are converted and written in bands of whole tiles, so every tile
+    is compressed once and no full copy of the values is needed. As Cloud
+    Optimized GeoTIFF the raster is written to a temporary file first, the
+    overviews are calculated and both are copied into one file with the
+    overviews in front.
+
+    Parameters
+    ----------
+    array: array
+        Suitability values, NaN where there is no data
+    transform: Affine
+    crs: CRS
+    path: str
+        Path of the raster
+    compress: str
+        'deflate', 'zstd', 'lzw' or None for no compression (default 'deflate')
+    cog: bool
+        Save as Cloud Optimized GeoTIFF with internal overviews (default False)
+    quantize: bool
+        Save as uint16 with scale and offset (default False: float32)
+    """
+
+    height, width = array.shape
+    if quantize:
+        dtype, nodata = 'uint16', QUANTIZED_NODATA
+        scale, offset = _quantization(array)
+    else:
+        dtype, nodata = 'float32', FLOAT_NODATA
+    options = creation_options(dtype, compress)
+    target = path[:-len('.tif')] + '_incomplete.tif' if cog else path
+
+    with rasterio.open(target, 'w', driver='GTiff', width=width, height=height, count=1, dtype=dtype,
+                       crs=crs, transform=transform, nodata=nodata, **options) as dst:
+        if quantize:
+            dst.scales = (scale,)
+            dst.offsets = (offset,)
+        rows = max(1, DEFAULT_CHUNK_PIXELS // max(1, width) // BLOCK_SIZE) * BLOCK_SIZE
+        for row in range(0, height, rows):
+            values = np.asarray(array[row:row + rows])
+            missing = np.isnan(values)
+            if quantize:
+                codes = np.clip(np.round((np.where(missing, offset, values) - offset) / scale), 0, QUANTIZED_NODATA - 1)
+                values = np.where(missing, QUANTIZED_NODATA, codes).astype(np.uint16)
+            else:
+                values = np.where(missing, np.float32(FLOAT_NODATA), values.astype(np.float32))
+            dst.write(values, 1, window=Window(0, row, width, values.shape[0]))
+
+    if cog:
+        with rasterio.open(target, 'r+') as dst:
+            dst.build_overviews(overview_factors(width, height), Resampling.average)
+            dst.update_tags(ns='rio_overview', resampling='average')
+        rasterio.shutil.copy(target, path, driver='GTiff', copy_src_overviews=True, **options)
+        os.remove(target)
+
+
+def overview_factors(width, height):
+    """Reduction factors of the overviews, halved until the raster fits into one tile
+
+    Parameters
+    ----------
+    width: int
+    height: int
+
+    Returns
+    -------
+    factors: list
+        Powers of two, empty for small rasters
+    """
+
+    factors = []
+    factor = 2
+    while max(width, height) / float(factor // 2) > BLOCK_SIZE:
+        factors.append(factor)
+        factor *= 2
+    return factors
+
+
+def unscale(src, values):
+    """Apply the scale and offset of a raster to values read from it
+
+    Parameters
+    ----------
+    src: rasterio dataset
+        Opened raster
+    values: array
+        Values of the first band, can be a masked array
+
+    Returns
+    -------
+    values: array
+        The values unchanged if the raster has no scale and offset, otherwise
+        float64 values (the mask of a masked array is kept)
+    """
+
+    scale, offset = src.scales[0], src.offsets[0]
+    if scale == 1 and offset == 0:
+        return values
+    return values.astype(np.float64) * scale + offset
+
+
+def read_unscaled(src, window):
+    """Values of a window of the first band with the scale and offset of the raster applied
+
+    Parameters
+    ----------
+    src: rasterio dataset
+        Opened raster
+    window: Window
+
+    Returns
+    -------
+    values: array
+        Values of the window
+    nodata: float
+        Nodata value of the values, NaN if the scale and offset were applied
+    """
+
+    data = src.read(1, window=window)
+    if src.scales[0] == 1 and src.offsets[0] == 0:
+        return data, src.nodata
+    values = unscale(src, data)
+    if src.nodata is not None and not np.isnan(src.nodata):
+        values[data == src.nodata] = np.nan
+    return values, np.nan
+
+
+def _quantization(array):
+    """Scale and offset that spread the values of an array over the codes 0 to 65534"""
+
+    lowest = np.inf
+    highest = -np.inf
+    rows = max(1, DEFAULT_CHUNK_PIXELS // max(1, array.shape[1]))
+    for row in range(0, array.shape[0], rows):
+        values = np.asarray(array[row:row + rows])
+        values = values[~np.isnan(values)]
+        if len(values) > 0:
+            lowest = min(lowest, float(values.min()))
+            highest = max(highest, float(values.max()))
+    if not np.isfinite(lowest):
+        return 1.0, 0.0
+    if highest == lowest:
+        return 1.0, lowest
+    return (highest - lowest) / (QUANTIZED_NODATA - 1), lowest
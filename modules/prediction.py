@@ -5,13 +5,14 @@ python 3.6.7<br>
 @date: 2019-05-30<br> 
 """
 
-import numpy as np
 import pandas as pd
-from osgeo import gdal
-from subprocess import call
 
+from modules.output_rasters import write_suitability
+from modules.resample_mask import mask_and_crop
+from modules.suitability import suitability, weighted_sum
 
-def prediction(working_dir, raster_data, weighting, buffer_size, result_name):
+
+def prediction(working_dir, raster_data, weighting, buffer_size, result_name, df_boxplot_statistics=None, mask_path=None, mask_cache_dir=None, threads=None, memory_budget=None, read_ahead=2, compress='deflate', cog=False, quantize=False):
     """Predictive Model
     
     This script takes the reclassified rasters and the calculated weighting factors. The result is a raster which shows the suitability.
@@ -28,17 +29,92 @@ def prediction(working_dir, raster_data, weighting, buffer_size, result_name):
         str
     result_name: str
         Name of the model
+    df_boxplot_statistics: dataframe
+        Boxplot statistics of the rasters. If they are given, the predictor variable
+        rasters are reclassified, weighted and added up in one pass by the function
+        'suitability', and no reclassified rasters are needed (default None)
+    mask_path: str
+        Path to a shapefile with the polygons to keep, e.g. the land mass. The
+        result is cropped to it and pixels outside of it get no data (default None: no mask)
+    mask_cache_dir: str
+        Directory of the cache of rasterized masks (default None: no cache, the mask is rasterized every time)
+    threads: int
+        Number of threads (default None: one per processor core)
+    memory_budget: float
+        Memory budget in MB, the rasters are processed in chunks that fit into it
+        (default None: no budget)
+    read_ahead: int
+        Number of rasters read ahead in the background while the current one is
+        processed (default 2, 0 to read one after the other)
+    compress: str
+        Compression of the result: 'deflate', 'zstd', 'lzw' or None (default 'deflate')
+    cog: bool
+        Save the result as Cloud Optimized GeoTIFF with internal overviews (default False)
+    quantize: bool
+        Save the result as uint16 with scale and offset instead of float32 (default False)
 
     Note
     ----
-    This function needs the output of the function 'reclassify_raster', this means multiple rasters, and the output of the function 'weighting_calculation', a Excelsheet located in working_dir + 'results/statistics/'.
+    Without df_boxplot_statistics this function needs the output of the function 'reclassify_raster', this means multiple rasters (taken from raster_data[item]['reclassified'] if it is set), and the output of the function 'weighting_calculation', a Excelsheet located in working_dir + 'results/statistics/'.
     The output file is saved as follows.
 
-    Type: Raster .tif
+    Type: Raster .tif, tiled (see write_suitability)
     File location: working_dir + 'results/'
-    File name: 'suitability_result' + result_name
+    File name: 'suitability_result' + result_name + '_resampled_cut'
+
+    The suitability is resampled to the buffer size by nearest neighbour and cut
+    with the mask in memory, only this raster is saved.
     """
 
+    prediction_weightings(working_dir, raster_data, [weighting], buffer_size, [result_name], result_name,
+                          df_boxplot_statistics, mask_path, mask_cache_dir, threads, memory_budget, read_ahead,
+                          compress, cog, quantize)
+
+
+def prediction_weightings(working_dir, raster_data, weightings, buffer_size, result_names, weighting_name, df_boxplot_statistics=None, mask_path=None, mask_cache_dir=None, threads=None, memory_budget=None, read_ahead=2, compress='deflate', cog=False, quantize=False):
+    """Predictive models of several weightings
+
+    Like prediction, but the classes of the rasters are read or calculated once
+    and used for the suitability of all weightings.
+
+    Parameters
+    ----------
+    working_dir: str
+        Working directory
+    raster_data: dict
+        Names and paths of the predictore variable rasters
+    weightings: list
+        Weightings, e.g. ['w1', 'w2']
+    buffer_size:
+        str
+    result_names: list
+        Name of the model of every weighting
+    weighting_name: str
+        Name of the model used by weighting_calculation and reclassify_rasters
+    df_boxplot_statistics: dataframe
+        Boxplot statistics of the rasters (see prediction)
+    mask_path: str
+        Path to a shapefile with the polygons to keep (see prediction)
+    mask_cache_dir: str
+        Directory of the cache of rasterized masks
+    threads: int
+        Number of threads used to read and process the rasters (default None: one per processor core)
+    memory_budget: float
+        Memory budget in MB (see prediction)
+    read_ahead: int
+        Number of rasters read ahead in the background (see prediction)
+    compress: str
+        Compression of the results (see prediction)
+    cog: bool
+        Save the results as Cloud Optimized GeoTIFF (see prediction)
+    quantize: bool
+        Save the results as uint16 with scale and offset (see prediction)
+
+    Note
+    ----
+    One raster 'suitability_result' + result_name + '_resampled_cut' is saved
+    for every weighting in working_dir + 'results/'.
+    """
 
     # Put the names of the rasters out of the dictionairy into a list
     rasternames = []
@@ -48,75 +124,52 @@ def prediction(working_dir, raster_data, weighting, buffer_size, result_name):
     path = working_dir + "tmp" + '/reclassified/'
     # set path to table with weighting factors
     weighting_df = pd.read_excel(working_dir + 
-        '/results/statistics/weighting' + result_name + '.xlsx', sheet_name='Sheet1')
-
-    # Calculate suitability 
-    # load the first raster
-    driver = gdal.GetDriverByName('GTiff')
-    raster = gdal.Open(path + rasternames[0] + '_reclassified' + result_name + '.tif')
-    band = raster.GetRasterBand(1)
-    raster_array = band.ReadAsArray()
-
-    # Multiply every value with personal weighting factor
-    print('Multiply ' + rasternames[0] + ' with weighting factor: ' +
-          str(weighting_df[rasternames[0]][weighting]))
-    raster_array = raster_array * weighting_df[rasternames[0]][weighting]
-    print('Add up: ' + rasternames[0])
-    raster_array_sum = raster_array.copy()
-
-    # loop over remaining rasters and add them up
-    for item in rasternames:
-        if item == rasternames[0]:
-            continue
-        # load raster
-        raster = gdal.Open(path + item + '_reclassified' + result_name +'.tif')
-        band = raster.GetRasterBand(1)
-        raster_array = band.ReadAsArray()
-
-        # Multiply every value with personal weighting factor
-        print('Multiply ' + item + ' with weighting factor: ' + str(weighting_df[item][weighting]))
-        raster_array = raster_array * weighting_df[item][weighting]
-        # and add up values
-        print('Add up: ' + item)
-        raster_array_sum = np.sum([raster_array_sum, raster_array], axis=0)
-
-    # convert integer values to float values  
-    raster_array_sum = raster_array_sum.astype(float)
-    print('Highest value: ' + str(np.max(raster_array_sum)))
-    print('Lowest value: ' + str(np.min(raster_array_sum)))
-    # normalize the raster values by dividing by the highest value
-    raster_array_sum_norm = np.divide(raster_array_sum, np.max(raster_array_sum))
-
-    # Export the final raster
-    # create new raster
-    raster_reclass = driver.Create(working_dir + 'results/suitability_result' + result_name +
-                                   '.tif', raster.RasterXSize, raster.RasterYSize, 1, gdal.GDT_Float32)
-    raster_reclass.GetRasterBand(1).WriteArray(raster_array_sum_norm)
-    # get and set the spatial ref system
-    proj = raster.GetProjection()
-    georef = raster.GetGeoTransform()
-    raster_reclass.SetProjection(proj)
-    raster_reclass.SetGeoTransform(georef)
-    # clear variable
-    raster_reclass = None
-
-    # Resample the result raster to the size of buffer diameter
-    #if buffer_size is 'flex':
-    #    buffer_size = '250' 
-    call(['gdalwarp', '-overwrite', '-tr', buffer_size, buffer_size,'-of', 'GTiff', working_dir + 'results/suitability_result' + result_name + '.tif',
-    working_dir + 'results/suitability_result' + result_name + '_resampled.tif'])
-
-    # If needed : 
-    # clip raster to landmass by a shapefile that masks the ocean and set nodatavalue to -9999
-    path_to_mask = working_dir + 'data' + '/example_data_set/mask_for_no_data_values/oceanmask.shp'
-
-    call(['gdalwarp', '-overwrite', '-of', 'GTiff', '-cutline', path_to_mask, '-crop_to_cutline', '-dstnodata', '-9999.0', working_dir + 'results/suitability_result' + result_name + '_resampled.tif', working_dir + 'results/suitability_result' + result_name + '_resampled_cut.tif'])
-
-
-
-    # delete the no longer required uncut raster
-    call(['rm', working_dir + 'results/suitability_result' + result_name + '.tif', working_dir + 'results/suitability_result' + result_name + '_resampled.tif'])
-
-    # delete the no longer required reclassified rasters
-    call(['rm', '-r', working_dir + 'data/reclassified/*'])
+        '/results/statistics/weighting' + weighting_name + '.xlsx', sheet_name='Sheet1')
+    weights = {}
+    for weighting in weightings:
+        weights[weighting] = {}
+        for item in rasternames:
+            weights[weighting][item] = weighting_df[item][weighting]
+
+    if df_boxplot_statistics is None:
+        # Calculate suitability from the reclassified rasters, at the size of buffer diameter
+        suitability_values, transform, crs = _suitability_from_class_rasters(
+            raster_data, rasternames, path, weights, weighting_name, buffer_size, threads, memory_budget,
+            working_dir + 'tmp/', read_ahead)
+    else:
+        # reclassify, weight and add up the predictor variable rasters in one pass, at the size of buffer diameter
+        suitability_values, transform, crs = suitability(
+            working_dir, raster_data, df_boxplot_statistics, weights, buffer_size, threads, memory_budget, read_ahead)
+
+    for weighting, result_name in zip(weightings, result_names):
+        values = suitability_values[weighting]
+        result_transform = transform
+
+        # If needed : 
+        # clip raster to landmass by a shapefile that masks the ocean and set nodatavalue to -9999
+        if mask_path is not None:
+            values, result_transform = mask_and_crop(values, result_transform, crs, mask_path, mask_cache_dir,
+                                                     memory_budget, working_dir + 'tmp/')
+
+        # Export the final raster
+        write_suitability(values, result_transform, crs,
+                          working_dir + 'results/suitability_result' + result_name + '_resampled_cut.tif',
+                          compress, cog, quantize)
     print('Model prediction finished\n')
+
+
+def _suitability_from_class_rasters(raster_data, rasternames, path, weights, result_name, resolution, threads=None, memory_budget=None, temporary_dir=None, read_ahead=2):
+    """Multiply the reclassified rasters with the weighting factors of every weighting, add them up and normalize the sums
+
+    The classes are read as vectors of the pixels where all reclassified rasters
+    have data, band by band (see weighted_sum). Returns the normalized sum of
+    every weighting at the pixels nearest to the pixel centers of the grid
+    resampled to the resolution (NaN where a raster has no data), its transform
+    and the coordinate reference system.
+    """
+
+    paths = [raster_data[item].get('reclassified', path + item + '_reclassified' + result_name + '.tif')
+             for item in rasternames]
+    # the values of the reclassified rasters are already the classes
+    return weighted_sum(rasternames, paths, [None] * len(paths), [None] * len(paths), weights, resolution,
+                        threads, memory_budget, temporary_dir, read_ahead)
@@ -8,6 +8,7 @@ Description:<br>
 """
 
 import json
+import shutil
 import geopandas as gpd
 import pandas as pd
 from sklearn.model_selection import KFold
@@ -17,171 +18,381 @@ from os import path
 # Load own functions, this are the modules for calculating the model
 from set_data_paths import rasterfilter
 from modules.average_raster_values import average_raster_values
-from modules.boxplots import boxplots
+from modules.boxplots import boxplots, boxplots_grid
+from modules.memory_budget import memory_report, start_memory_report
+from modules.raster_catalog import raster_catalog
+from modules.raster_stack import raster_stack
 from modules.reclassify_rasters import reclassify_rasters
 from modules.weighting import weighting_calculation
-from modules.prediction import prediction
+from modules.prediction import prediction_weightings
 from modules.validation import validation
+from modules.gain_curve import gain_at
 from modules.gain_statistics import gain
+from modules.site_sampler import sample_sites
+
+# options that are used if they are not set in run_modelling.py
+default_options = {
+    'value_cache': True,
+    'value_cache_size': 1000000,
+    'site_points': None,
+    'site_buffer_sizes': None,
+    'zonal_statistic': 'mean',
+    'write_intermediates': False,
+    'reference_raster': None,
+    'raster_stack': False,
+    'mask_path': 'example_data_set/mask_for_no_data_values/oceanmask.shp',
+    'class_rasters': False,
+    'reclass_cache': True,
+    'reclass_cache_size': 200,
+    'threads': None,
+    'memory_budget': None,
+    'read_ahead': 2,
+    'output_compress': 'deflate',
+    'output_cog': False,
+    'output_quantize': False,
+    'gain_thresholds': 1000,
+}
  
  
-def modelling_process(buffer_size, weighting,statistic_threshold,corr_threshold,statistic_threshold_type, all_raster_data, variables,combination, test, working_dir, buffer_dir):
+def modelling_process(buffer_size, weighting,statistic_threshold,corr_threshold,statistic_threshold_type, all_raster_data, variables,combination, test, working_dir, buffer_dir, options=None):
+    # a single model is a grid with one point
+    modelling_process_grid(buffer_size, [weighting], [statistic_threshold], [corr_threshold], [statistic_threshold_type],
+                           all_raster_data, variables, combination, test, working_dir, buffer_dir, options)
+
+
+def modelling_process_grid(buffer_size, weightings, statistic_thresholds, corr_thresholds, statistic_threshold_types, all_raster_data, variables, combination, test, working_dir, buffer_dir, options=None):
+    """Calculate the models of all combinations of weightings and thresholds
+
+    The raster values of the sites, the boxplot statistics and the correlation
+    matrix do not depend on the weightings and thresholds, so they are calculated
+    once. The variables are selected for every combination of thresholds, and
+    grid points with the same selected variables share one model: reclassification,
+    weighting factors and validation are calculated only once for them, and the
+    suitability of all weightings is calculated from the same classes. The results
+    are written for every grid point under its own name, the correlation matrix
+    and weighting factors are copied to the names of all grid points.
+
+    Parameters
+    ----------
+    buffer_size: str
+    weightings: list
+    statistic_thresholds: list
+    corr_thresholds: list
+    statistic_threshold_types: list
+    all_raster_data: dict
+    variables: list
+        Predictor variables of the combination
+    combination: str
+        Name of the combination
+    test: bool
+        True for cross-validation
+    working_dir: str
+    buffer_dir: str
+    options: dict
+        Further options, see default_options
+    """
+
+    # complete the options with the default options
+    options = dict(default_options, **(options or {}))
+    # directory of the persistent cache of extracted site values
+    if options['value_cache']:
+        cache_dir = working_dir + 'tmp/value_cache/'
+    else:
+        cache_dir = None
+    # check the grids of all predictor variable rasters, rasters on another grid are aligned once and kept in tmp/aligned/
+    all_raster_data = raster_catalog(working_dir, all_raster_data, options['reference_raster'])
+    # decode all predictor variable rasters once into the memory-mapped raster stack in tmp/stack/
+    if options['raster_stack']:
+        all_raster_data = raster_stack(working_dir, all_raster_data)
     # make a subset of only the current predictore variable combination
     raster_data = rasterfilter(all_raster_data, variables)
-    iqr_start = statistic_threshold
-    corr_start = corr_threshold
-    # generate a name for the currently calculated model
-    result_name = "{}_{}m_{}_{}_{}_{}_{}".format(
-        combination, buffer_size,  weighting,  iqr_start, corr_start,statistic_threshold_type, test)
     # load json-file including names of already calculated combinations
     already_done = json.loads(
-        open(working_dir + 'calculated_combinations.json').read())      
-    # skip over already calculated combinations
-    if result_name in already_done.keys():
-        print("This combination of variables and parameters was already calculated. Skip to the next combination.\n")
+        open(working_dir + 'calculated_combinations.json').read())
 
-    else:
+    # generate a name for every model of the grid and skip over already calculated combinations
+    grid = {}
+    for weighting in weightings:
+        for statistic_threshold in statistic_thresholds:
+            for corr_threshold in corr_thresholds:
+                for statistic_threshold_type in statistic_threshold_types:
+                    result_name = "{}_{}m_{}_{}_{}_{}_{}".format(
+                        combination, buffer_size,  weighting,  statistic_threshold, corr_threshold,statistic_threshold_type, test)
+                    # models with another statistic of the raster values within the buffers get their own name
+                    if options['zonal_statistic'] != 'mean':
+                        result_name += '_' + options['zonal_statistic']
+                    if result_name in already_done.keys():
+                        print("This combination of variables and parameters was already calculated. Skip to the next combination.\n")
+                    else:
+                        grid[(weighting, statistic_threshold, corr_threshold, statistic_threshold_type)] = result_name
+    if not grid:
+        return
+
+    if options['site_points'] is None:
         # import the shapefile of buffers
         buffer_shapefile = gpd.read_file(
             working_dir + 'data/' + buffer_dir + buffer_size + '_m_sites.shp')
         print(working_dir + 'data/' + buffer_dir + buffer_size + '_m_sites.shp')
-        # prepare empty variables to be filled with data
-        x_list = []
-        y_list = []
-        value_list = []
-        percent_good_prediction = None
-        gdf = None
-        result_gdf = gpd.GeoDataFrame({'suitability_value': [0,0], 'geometry': [0,0] })
-
-        print('\n Calculating model: ' + str(result_name))
-        print('Predictore variable rasters: ' + str(raster_data.keys()) + '\n')
-
-        # start model calculation
-        traindata = buffer_shapefile
-        testdata = buffer_shapefile
-        # get raster values within buffers
-        average_raster_values(
-            working_dir, raster_data, result_name, traindata)
-
-        raster_selection, correlation_matrix, df_boxplots_results  = boxplots(
-            working_dir, result_name, raster_data, statistic_threshold, corr_threshold, statistic_threshold_type)
-
-        raster_data = rasterfilter(
-            raster_data, raster_selection)
+        radius = None
+    else:
+        # import the shapefile of site points, the buffers are calculated around them
+        buffer_shapefile = gpd.read_file(working_dir + 'data/' + options['site_points'])
+        print(working_dir + 'data/' + options['site_points'] + ', buffer size ' + buffer_size + ' m')
+        # the buffer size is the diameter of the buffers, like the size of the polygons in <size>_m_sites.shp
+        radius = _circle_radius(buffer_size)
+
+    # the raster values and statistics are calculated once, under the name of the first model
+    first_name = next(iter(grid.values()))
+    print('\n Calculating models: ' + ', '.join(grid.values()))
+    print('Predictore variable rasters: ' + str(raster_data.keys()) + '\n')
+    # get raster values within buffers
+    sites = average_raster_values(
+        working_dir, raster_data, first_name, buffer_shapefile, cache_dir, options['value_cache_size'], radius, _site_radii(options), options['zonal_statistic'],
+        options['write_intermediates'])
+
+    selections, correlation_matrix, df_boxplot_statistics = boxplots_grid(
+        working_dir, first_name, raster_data, sites, statistic_thresholds, corr_thresholds, statistic_threshold_types,
+        options['write_intermediates'])
+    # every grid point gets the correlation matrix under its own name
+    _copy_statistics(working_dir, 'Correlation_matrix_', first_name, grid.values())
+
+    # grid points with the same selected variables share one model
+    models = {}
+    for point in grid:
+        selection_list, cost_distance_list = selections[point[1:]]
+        models.setdefault(frozenset(selection_list + cost_distance_list), []).append(point)
+
+    for selected, points in models.items():
+        # the model of every weighting is calculated under the name of its first grid point
+        model_names = {}
+        for point in points:
+            model_names.setdefault(point[0], grid[point])
+        # the weighting factors of all weightings are saved under the name of the first model
+        weighting_name = grid[points[0]]
+        df_boxplots_results = df_boxplot_statistics[
+            [item for item in df_boxplot_statistics.columns if item in selected]]
+        print(df_boxplots_results)
+        model_raster_data = rasterfilter(raster_data, list(selected))
+        model_results = _calculate_model(
+            working_dir, model_raster_data, model_names, weighting_name, df_boxplots_results, buffer_shapefile, buffer_size, test,
+            points[0][3], cache_dir, radius, options)
+        # every grid point gets the weighting factors under its own name, with crossvalidation
+        # also the correlation matrix of the last subset, like the single models
+        point_names = [grid[point] for point in points]
+        _copy_statistics(working_dir, 'weighting', weighting_name, point_names)
+        if test is True:
+            _copy_statistics(working_dir, 'Correlation_matrix_', weighting_name, point_names)
+
+        weighting_df = pd.read_excel(working_dir +'/results/statistics/weighting' + weighting_name + '.xlsx', sheet_name='Sheet1')
+        for point in points:
+            weighting, statistic_threshold, corr_threshold, statistic_threshold_type = point
+            result_name = grid[point]
+            model_name = model_names[weighting]
+            gain_df, gain_metrics, percent_good_prediction, result_gdf = model_results[weighting]
+            selection_list, cost_distance_list = selections[point[1:]]
+            raster_selection = selection_list + cost_distance_list
+
+            # write model parameters, correlation matrix and validation output to text file
+            file = open(working_dir + 'results/info_and_validation_' + result_name + '.txt', 'w')
+            file.write('Model name: \n')
+            file.write(str(result_name) + '\n \n')
+            if result_name != model_name:
+                file.write('Same predictor variables as model ' + model_name + ', the results of this model are used.\n \n')
+            file.write('Correlation matrix: results/statistics/Correlation_matrix_' + result_name + '.xlsx\n')
+            file.write('Weighting factors: results/statistics/weighting' + result_name + '.xlsx\n \n')
+            file.write('Parameters: \n')
+            for item in model_raster_data:
+                file.write(
+                    item + ' * ' + str(weighting_df[item][weighting]) + '\n')
+            if test is True:
+                file.write('\nCross-validation results: \n')
+                file.write(str(result_gdf[['suitability_value', 'geometry']]) + '\n \n')
+            # gain at the thresholds 0.5 and 0.75, taken from the gain curve
+            gain_050, gain_075 = gain_at(gain_metrics['curve'], [0.5, 0.75])['gain']
+            file.write(str(percent_good_prediction) +
+                        ' percent of data is located in suitability area > 0.5 \n\n')
+            file.write('Gain statistics: \n')
+            file.write(str(gain_df) + '\n \n')
+            file.write('AUC: ' + str(gain_metrics['auc']) + '\n')
+            file.write('ROC AUC: ' + str(gain_metrics['roc_auc']) + '\n')
+            file.write('Continuous Boyce index: ' + str(gain_metrics['boyce']) + '\n')
+            file.close()
+
+            # gain of the suitability zones and the whole gain curve
+            writer = pd.ExcelWriter(working_dir + 'results/gain' + result_name + '.xlsx')
+            gain_df.to_excel(writer, sheet_name='Sheet1')
+            gain_metrics['curve'].to_excel(writer, sheet_name='curve')
+            writer.save()
+
+            # save results in excel
+            new_results = pd.DataFrame({'Combination name': combination, 'buffer size': buffer_size, 'weighting': weighting, 'statistic_threshold': statistic_threshold, 'corr_threshold': corr_threshold, 'crossvalidation active': test, 'rasters': [raster_selection], 'percent good prediction': percent_good_prediction, 'gain_0.5': gain_050,
+            'gain_0.75': gain_075, 'auc': gain_metrics['auc'], 'roc_auc': gain_metrics['roc_auc'], 'boyce': gain_metrics['boyce'],
+            'statistic threshold type': statistic_threshold_type
+            })
+
+            if path.exists(working_dir + 'results/results.xlsx'):
+                all_results = pd.read_excel(working_dir + 'results/results.xlsx')
+                all_results = all_results.append(
+                    new_results, ignore_index=True)
+                all_results.to_excel(working_dir + 'results/results.xlsx')
+            else:
+                new_results.to_excel(
+                    working_dir + 'results/results.xlsx')
+
+            # add entry with current model name and prediction value to json-file
+            already_done[result_name] = percent_good_prediction,  gain_050, gain_075
+            with open(working_dir + 'calculated_combinations.json', 'w') as outfile:
+                json.dump(already_done, outfile)
+
+
+def _copy_statistics(working_dir, prefix, source_name, result_names):
+    """Copy a statistics file saved under the name of one model to the names of other models"""
+
+    source = working_dir + 'results/statistics/' + prefix + source_name + '.xlsx'
+    for result_name in result_names:
+        if result_name != source_name:
+            shutil.copyfile(source, working_dir + 'results/statistics/' + prefix + result_name + '.xlsx')
+
+
+def _circle_radius(buffer_size):
+    """Radius of the circle around a site point for a buffer size, which is a diameter"""
 
+    return float(buffer_size) / 2
+
+
+def _site_radii(options):
+    """Radii of the circles of all buffer sizes in options['site_buffer_sizes'], None if they are not set"""
+
+    if options['site_buffer_sizes'] is None:
+        return None
+    return [_circle_radius(buffer_size) for buffer_size in options['site_buffer_sizes']]
+
+
+def _calculate_model(working_dir, raster_data, model_names, weighting_name, df_boxplots_results, buffer_shapefile, buffer_size, test, statistic_threshold_type, cache_dir, radius, options):
+    """Calculate the prediction, gain and validation of the models of several weightings with the same selected variables
+
+    Parameters
+    ----------
+    model_names: dict
+        Name of the model of every weighting
+    weighting_name: str
+        Name under which the weighting factors and class rasters are saved
+
+    Returns
+    -------
+    model_results: dict
+        For every weighting a tuple of gain_df, gain_metrics (see gain),
+        percent_good_prediction and result_gdf (validation results)
+    """
+
+    weightings = list(model_names)
+    result_names = [model_names[weighting] for weighting in weightings]
+    # prepare empty variables to be filled with data, one set per weighting
+    x_lists = {weighting: [] for weighting in weightings}
+    y_lists = {weighting: [] for weighting in weightings}
+    value_lists = {weighting: [] for weighting in weightings}
+    model_results = {}
+    testdata = buffer_shapefile
+
+    print('\n Calculating models: ' + ', '.join(result_names))
+    print('Predictore variable rasters: ' + str(raster_data.keys()) + '\n')
+    # with a memory budget the peak Python heap and resident memory of the models are reported
+    if options['memory_budget'] is not None:
+        start_memory_report()
+
+    # mask of the land mass (inside the data folder), rasterized once per grid and kept in tmp/masks/
+    if options['mask_path'] is None:
+        mask_path = None
+    else:
+        mask_path = working_dir + 'data/' + options['mask_path']
+    mask_cache_dir = working_dir + 'tmp/masks/'
+    # directory of the cache of reclassified rasters
+    if options['reclass_cache']:
+        reclass_cache_dir = working_dir + 'tmp/reclass_cache/'
+    else:
+        reclass_cache_dir = None
+    # without class rasters the rasters are reclassified within the prediction
+    if options['class_rasters']:
         reclassify_rasters(
-            working_dir,  raster_data, result_name, df_boxplots_results)
+            working_dir,  raster_data, weighting_name, df_boxplots_results, reclass_cache_dir, options['reclass_cache_size'],
+            options['threads'], options['memory_budget'], options['read_ahead'], options['output_compress'])
+        prediction_statistics = None
+    else:
+        prediction_statistics = df_boxplots_results
 
-        weighting_calculation(working_dir, result_name, df_boxplots_results )
+    weighting_calculation(working_dir, weighting_name, df_boxplots_results )
 
-        prediction(working_dir, raster_data,
-                weighting, buffer_size, result_name)
+    # the suitability of all weightings is calculated from the same classes
+    prediction_weightings(working_dir, raster_data,
+            weightings, buffer_size, result_names, weighting_name, prediction_statistics, mask_path, mask_cache_dir, options['threads'],
+            options['memory_budget'], options['read_ahead'], options['output_compress'], options['output_cog'],
+            options['output_quantize'])
 
-        gain_df = gain(working_dir, result_name,
-                    buffer_shapefile)
+    gain_results = {}
+    site_samples = {}
+    for weighting, result_name in zip(weightings, result_names):
+        # the sites are sampled once, for the gain and (without crossvalidation) the validation
+        site_samples[weighting] = sample_sites(working_dir + 'results/suitability_result' + result_name + '_resampled_cut.tif',
+                                               buffer_shapefile.geometry.values, 5, mask_path, mask_cache_dir)
+        gain_results[weighting] = gain(working_dir, result_name,
+                    buffer_shapefile, mask_path, mask_cache_dir, options['memory_budget'], site_samples[weighting],
+                    options['gain_thresholds'])
 
         print('Calculation of model ' +
             str(result_name) + ' is finished.\n')
 
-        # if validation is turned on, data is splitted in subsets for crossvalidation
-        if test is True:
-            # prepare empty variables to be filled with data
-            x_list = []
-            y_list = []
-            value_list = []
-            percent_good_prediction = None
-            gdf = None
-            result_gdf = gpd.GeoDataFrame(
-                {'suitability_value': [0, 0], 'geometry': [0, 0]})
-            # set threshold very high, to be sure that the same rasters are used for the crossvalidation model as in the 'normal' model
-            statistic_threshold = 100
-            corr_threshold = 1
-
-            print('\n Start crossvalidation: ')
-
-            kf = KFold(n_splits=5, random_state=None)
-            repeat_index = 0
-            # loop over the 5 subsets
-            for train_index, test_index in kf.split(buffer_shapefile):
-                repeat_index += 1
-                # print("Train:", train_index, "Validation:", test_index)
-                # get the current train- and testdata buffers
-                traindata, testdata = buffer_shapefile.loc[train_index], buffer_shapefile.loc[test_index]
-                # print(traindata)
-                # print(testdata)
-
-                # model calculation for current combination starts
-                # get raster values within buffers
-                average_raster_values(working_dir,  raster_data, result_name, traindata)
-
-                raster_selection, correlation_matrix, df_boxplots_results  = boxplots(working_dir, result_name, raster_data, statistic_threshold, corr_threshold, statistic_threshold_type)
-
-                reclassify_rasters(working_dir,  raster_data, result_name, df_boxplots_results )
-
-                weighting_calculation(working_dir, result_name, df_boxplots_results )
-
-                prediction(working_dir, raster_data, weighting, buffer_size, result_name)
-
-                x_list, y_list, value_list, percent_good_prediction, result_gdf = validation(working_dir, result_name, testdata, x_list, y_list, value_list)
-                print('Round ' + str(repeat_index) + ' of 5 from crossvalidation finished')
-
-        if test is False:
-            x_list, y_list, value_list, percent_good_prediction, result_gdf = validation(
-                working_dir, result_name, testdata, x_list, y_list, value_list)
-            print(str(percent_good_prediction) +
-                ' percent of data is located in suitability area > 0.5\n')
+    # if validation is turned on, data is splitted in subsets for crossvalidation
+    if test is True:
+        # set threshold very high, to be sure that the same rasters are used for the crossvalidation model as in the 'normal' model
+        statistic_threshold = 100
+        corr_threshold = 1
 
+        print('\n Start crossvalidation: ')
 
-        weighting_df = pd.read_excel(working_dir +'/results/statistics/weighting' + result_name + '.xlsx', sheet_name='Sheet1')
-        # write model parameters, correlation matrix and validation output to text file
-        file = open(working_dir + 'results/info_and_validation_' + result_name + '.txt', 'w')
-        file.write('Model name: \n')
-        file.write(str(result_name) + '\n \n')
-        file.write('Parameters: \n')
-        for item in raster_data:
-            file.write(
-                item + ' * ' + str(weighting_df[item][weighting]) + '\n')
-        #if test is False:
-        #    file.write('Correlation:\n')
-        #    file.write(str(correlation_matrix) + '\n')
-        if test is True:
-            file.write('\nCross-validation results: \n')
-            file.write(str(result_gdf[['suitability_value', 'geometry']]) + '\n \n')
-        gain_075 = (gain_df.iloc[8]['gain'])
-        file.write(str(percent_good_prediction) +
-                    ' percent of data is located in suitability area > 0.5 \n\n')
-        #file.write('Gain values of suitability areas > 0.8: ' + str(gain_over_08) + '\n\n')
-        file.write('Gain statistics: \n')
-        file.write(str(gain_df))
-        file.close()
-
-        gain_df.to_excel(
-            working_dir +
-            'results/gain' + result_name + '.xlsx')
-
-        # delete the no longer required reclassified rasters
-        #call(['rm', '-r', working_dir + 'tmp/sites_with_rastervalues/*'])
-
-        # delete result rasters and shapefiles
-        #call(['rm', working_dir + 'results/suitability_result' + result_name + '_resampled_cut.tif'])
-        #call(['rm', '-r', working_dir + 'results/suitability_shapefiles/*'])
-        #call(['rm', '-r', working_dir + 'results/statistics/*'])
-
-        # save results in excel
-        new_results = pd.DataFrame({'Combination name': combination, 'buffer size': buffer_size, 'weighting': weighting, 'statistic_threshold': iqr_start, 'corr_threshold': corr_start, 'crossvalidation active': test, 'rasters': [raster_selection], 'percent good prediction': percent_good_prediction, 'gain_0.5': gain_df.iloc[5]['gain'],
-        'gain_0.75': gain_075, 'statistic threshold type': statistic_threshold_type
-        })
-
-        if path.exists(working_dir + 'results/results.xlsx'):
-            all_results = pd.read_excel(working_dir + 'results/results.xlsx')
-            all_results = all_results.append(
-                new_results, ignore_index=True)
-            all_results.to_excel(working_dir + 'results/results.xlsx')
-        else:
-            new_results.to_excel(
-                working_dir + 'results/results.xlsx')
-
-        # add entry with current model name and prediction value to json-file
-        already_done[result_name] = percent_good_prediction,  gain_df.iloc[5]['gain'], gain_075
-        with open(working_dir + 'calculated_combinations.json', 'w') as outfile:
-            json.dump(already_done, outfile)
+        kf = KFold(n_splits=5, random_state=None)
+        repeat_index = 0
+        # loop over the 5 subsets
+        for train_index, test_index in kf.split(buffer_shapefile):
+            repeat_index += 1
+            # get the current train- and testdata buffers
+            traindata, testdata = buffer_shapefile.loc[train_index], buffer_shapefile.loc[test_index]
+
+            # model calculation for current combination starts
+            # get raster values within buffers
+            sites = average_raster_values(working_dir,  raster_data, weighting_name, traindata, cache_dir, options['value_cache_size'], radius, _site_radii(options), options['zonal_statistic'],
+                                          options['write_intermediates'])
+
+            raster_selection, correlation_matrix, df_boxplots_results  = boxplots(working_dir, weighting_name, raster_data, sites, statistic_threshold, corr_threshold, statistic_threshold_type,
+                                                                                  options['write_intermediates'])
+
+            if options['class_rasters']:
+                reclassify_rasters(working_dir,  raster_data, weighting_name, df_boxplots_results, reclass_cache_dir, options['reclass_cache_size'],
+                                   options['threads'], options['memory_budget'], options['read_ahead'],
+                                   options['output_compress'])
+                prediction_statistics = None
+            else:
+                prediction_statistics = df_boxplots_results
+
+            weighting_calculation(working_dir, weighting_name, df_boxplots_results )
+
+            prediction_weightings(working_dir, raster_data, weightings, buffer_size, result_names, weighting_name, prediction_statistics, mask_path, mask_cache_dir,
+                                  options['threads'], options['memory_budget'], options['read_ahead'],
+                                  options['output_compress'], options['output_cog'], options['output_quantize'])
+
+            for weighting, result_name in zip(weightings, result_names):
+                x_lists[weighting], y_lists[weighting], value_lists[weighting], percent_good_prediction, result_gdf = validation(
+                    working_dir, result_name, testdata, x_lists[weighting], y_lists[weighting], value_lists[weighting], mask_path, mask_cache_dir)
+                model_results[weighting] = gain_results[weighting] + (percent_good_prediction, result_gdf)
+            print('Round ' + str(repeat_index) + ' of 5 from crossvalidation finished')
+
+    if test is False:
+        for weighting, result_name in zip(weightings, result_names):
+            x_lists[weighting], y_lists[weighting], value_lists[weighting], percent_good_prediction, result_gdf = validation(
+                working_dir, result_name, testdata, x_lists[weighting], y_lists[weighting], value_lists[weighting], mask_path, mask_cache_dir,
+                site_samples[weighting])
+            print(str(percent_good_prediction) +
+                ' percent of data is located in suitability area > 0.5\n')
+            model_results[weighting] = gain_results[weighting] + (percent_good_prediction, result_gdf)
+    if options['memory_budget'] is not None:
+        memory_report(', '.join(result_names), options['memory_budget'])
+    return model_results
@@ -0,0 +1,141 @@
+"""
+raster_catalog.py<br>
+python 3.6.7<br>
+Definition of functions to check the grids of the predictor variable rasters and to align them to one grid<br>
+@author: Lisa Stubert<br>
+@date: 2019-05-30<br>
+"""
+
+import hashlib
+import os
+
+import numpy as np
+import rasterio
+from rasterio.enums import Resampling
+from rasterio.vrt import WarpedVRT
+
+from modules.fingerprint import file_fingerprint
+from modules.raster_windows import chunk_windows
+
+
+def raster_catalog(working_dir, all_raster_data, reference=None, aligned_dir=None, resampling='nearest'):
+    """Check that all predictor variable rasters are on one grid and align the others
+
+    Only the metadata of the rasters is read. Every raster is compared with the
+    grid of the reference raster: coordinate reference system, resolution,
+    alignment of the pixels and extent. A raster that differs is warped once to
+    the reference grid (window by window, with a WarpedVRT) and the aligned copy
+    is saved in aligned_dir under a key made of the content of the raster, the
+    reference grid and the resampling method, so later models and runs reuse it.
+    Pixels of the reference grid outside of the raster get no data.
+
+    Parameters
+    ----------
+    working_dir: str
+        Working directory
+    all_raster_data: dict
+        Names and paths of all predictor variable rasters
+    reference: str
+        Name of the raster whose grid is used (default None: the first raster)
+    aligned_dir: str
+        Directory of the aligned copies (default working_dir + 'tmp/aligned/')
+    resampling: str
+        Resampling method of rasterio.enums.Resampling used for the aligned copies
+        (default 'nearest', like gdalwarp)
+
+    Returns
+    -------
+    aligned_raster_data: dict
+        Copy of all_raster_data in which the path of every raster that was not on
+        the reference grid points to its aligned copy (relative to the data folder)
+        and 'source_path' holds the original path
+    """
+
+    if aligned_dir is None:
+        aligned_dir = working_dir + 'tmp/aligned/'
+    path_rasters = working_dir + "data/"
+    names = list(all_raster_data)
+    if reference is None:
+        reference = names[0]
+    with rasterio.open(path_rasters + all_raster_data[reference]['path']) as src:
+        grid = {'crs': src.crs, 'transform': src.transform, 'width': src.width, 'height': src.height}
+
+    aligned_raster_data = {}
+    for name in names:
+        raster_path = path_rasters + all_raster_data[name]['path']
+        with rasterio.open(raster_path) as src:
+            differences = grid_differences(src, grid)
+        aligned_raster_data[name] = dict(all_raster_data[name])
+        if not differences:
+            continue
+        print('Raster ' + name + ' is not on the grid of ' + reference + ' (' + ', '.join(differences) + ')')
+        aligned_path = _aligned_copy(raster_path, grid, aligned_dir, resampling)
+        aligned_raster_data[name]['path'] = os.path.relpath(aligned_path, path_rasters)
+        aligned_raster_data[name]['source_path'] = all_raster_data[name]['path']
+    return aligned_raster_data
+
+
+def grid_differences(src, grid):
+    """Differences between the grid of a raster and a reference grid
+
+    Parameters
+    ----------
+    src: rasterio dataset
+        Opened raster
+    grid: dict
+        'crs', 'transform', 'width' and 'height' of the reference grid
+
+    Returns
+    -------
+    differences: list
+        'crs', 'resolution', 'alignment' and/or 'extent', empty if the raster is
+        on the reference grid
+    """
+
+    transform = grid['transform']
+    if src.crs != grid['crs']:
+        # the other properties can not be compared in different coordinate reference systems
+        return ['crs']
+    differences = []
+    if not np.allclose([src.transform.a, src.transform.b, src.transform.d, src.transform.e],
+                       [transform.a, transform.b, transform.d, transform.e]):
+        differences.append('resolution')
+    # offset of the origin in pixels of the reference grid, it must be a whole number of pixels
+    col, row = ~transform * (src.transform.c, src.transform.f)
+    if not differences and not np.allclose([col, row], np.round([col, row]), rtol=0, atol=1e-6):
+        differences.append('alignment')
+    if not np.allclose([col, row], 0, rtol=0, atol=1e-6) or (src.width, src.height) != (grid['width'], grid['height']):
+        differences.append('extent')
+    return differences
+
+
+def _aligned_copy(raster_path, grid, aligned_dir, resampling):
+    """Path of the copy of a raster warped to the reference grid, made if it is not in aligned_dir yet"""
+
+    description = '{};{};{};{};{};{}'.format(
+        file_fingerprint(raster_path, aligned_dir), grid['crs'].to_wkt() if grid['crs'] is not None else '',
+        tuple(grid['transform'])[:6], grid['width'], grid['height'], resampling)
+    aligned_path = os.path.join(aligned_dir, hashlib.sha1(description.encode()).hexdigest() + '.tif')
+    if os.path.exists(aligned_path):
+        return aligned_path
+
+    os.makedirs(aligned_dir, exist_ok=True)
+    # the copy is written to a temporary file first, so an interrupted run never leaves a broken copy
+    temporary_path = aligned_path[:-len('.tif')] + '_incomplete.tif'
+    with rasterio.open(raster_path) as src:
+        # pixels without data are NaN if the raster has no nodata value
+        nodata = src.nodata if src.nodata is not None else np.nan
+        profile = {'driver': 'GTiff', 'width': grid['width'], 'height': grid['height'], 'count': 1,
+                   'dtype': 'float32', 'crs': grid['crs'], 'transform': grid['transform'], 'nodata': nodata,
+                   'tiled': True, 'blockxsize': 256, 'blockysize': 256, 'compress': 'deflate'}
+        with WarpedVRT(src, crs=grid['crs'], transform=grid['transform'], width=grid['width'],
+                       height=grid['height'], nodata=nodata, resampling=Resampling[resampling]) as vrt:
+            with rasterio.open(temporary_path, 'w', **profile) as dst:
+                # the values are copied unchanged, so the copy keeps the scale and offset of the raster
+                dst.scales = src.scales[:1]
+                dst.offsets = src.offsets[:1]
+                # only the part of the raster needed for one window is warped at a time
+                for window in chunk_windows(dst):
+                    dst.write(vrt.read(1, window=window).astype(np.float32), 1, window=window)
+    os.replace(temporary_path, aligned_path)
+    return aligned_path
@@ -0,0 +1,195 @@
+"""
+raster_stack.py<br>
+python 3.6.7<br>
+Definition of functions to convert the predictor variable rasters into one memory-mapped stack<br>
+@author: Lisa Stubert<br>
+@date: 2019-05-30<br>
+"""
+
+import json
+import os
+from xml.sax.saxutils import escape
+
+import numpy as np
+import rasterio
+
+from modules.fingerprint import file_fingerprint
+from modules.output_rasters import unscale
+from modules.raster_catalog import grid_differences
+from modules.raster_windows import chunk_windows
+
+
+def raster_stack(working_dir, all_raster_data, stack_dir=None):
+    """Convert all predictor variable rasters into one memory-mapped stack
+
+    The rasters are decoded once and saved as raw float32 values, band after band
+    (band sequential), in the file 'stack.bsq' with a small JSON header
+    'stack.json'. Pixels without data are NaN. For every band a VRT file is saved
+    next to it, which points into the stack, so every function that opens a raster
+    by its path reads the raw values without decoding. The stack is only built
+    again if the content of one of the rasters has changed or a raster was added.
+
+    Parameters
+    ----------
+    working_dir: str
+        Working directory
+    all_raster_data: dict
+        Names and paths of all predictor variable rasters, all on the same grid
+        (see raster_catalog), otherwise a ValueError is raised
+    stack_dir: str
+        Directory of the stack (default working_dir + 'tmp/stack/')
+
+    Returns
+    -------
+    stack_raster_data: dict
+        Copy of all_raster_data in which the path of every raster points to its
+        VRT file (relative to the data folder) and 'stack' holds the path of the
+        stack and the number of the band, see stack_band
+
+    Note
+    ----
+    The values are saved as float32, integer rasters keep their values, float64
+    rasters are rounded to float32.
+    """
+
+    if stack_dir is None:
+        stack_dir = working_dir + 'tmp/stack/'
+    os.makedirs(stack_dir, exist_ok=True)
+    path_rasters = working_dir + "data/"
+    names = list(all_raster_data)
+    fingerprints = [file_fingerprint(path_rasters + all_raster_data[name]['path'], stack_dir) for name in names]
+    stack_path = os.path.join(stack_dir, 'stack.bsq')
+    header_path = os.path.join(stack_dir, 'stack.json')
+
+    header = None
+    if os.path.exists(header_path):
+        with open(header_path) as header_file:
+            header = json.load(header_file)
+    if header is None or header['bands'] != names or header['fingerprints'] != fingerprints:
+        header = _build_stack(path_rasters, all_raster_data, names, fingerprints, stack_path, header_path)
+
+    stack_raster_data = {}
+    for band, name in enumerate(names):
+        vrt_path = os.path.join(stack_dir, name + '.vrt')
+        _write_vrt(vrt_path, header, band)
+        stack_raster_data[name] = dict(all_raster_data[name])
+        stack_raster_data[name]['path'] = os.path.relpath(vrt_path, path_rasters)
+        stack_raster_data[name]['stack'] = (stack_path, band)
+    return stack_raster_data
+
+
+def stack_band(raster_entry):
+    """Values of a raster from the stack, without copying them
+
+    Parameters
+    ----------
+    raster_entry: dict
+        Entry of the raster dictionary returned by raster_stack
+
+    Returns
+    -------
+    band: array
+        Read-only memory map (rows x columns) of the float32 values, NaN where
+        there is no data, or None if the raster is not in a stack
+    """
+
+    if 'stack' not in raster_entry:
+        return None
+    stack_path, band = raster_entry['stack']
+    with open(os.path.splitext(stack_path)[0] + '.json') as header_file:
+        header = json.load(header_file)
+    return np.memmap(stack_path, dtype='<f4', mode='r',
+                     offset=band * header['height'] * header['width'] * 4,
+                     shape=(header['height'], header['width']))
+
+
+def read_window(src, band, window):
+    """Values of a window of a raster, taken from the stack without copying if the raster is in one
+
+    Parameters
+    ----------
+    src: rasterio dataset
+        Opened raster
+    band: array
+        Memory map returned by stack_band, or None
+    window: Window
+
+    Returns
+    -------
+    values: array
+        Masked array read from src with the scale and offset of the raster applied (see unscale),
+        or a view of the memory map with NaN where there is no data
+    """
+
+    if band is None:
+        return unscale(src, src.read(1, window=window, masked=True))
+    return band[window.toslices()]
+
+
+def _build_stack(path_rasters, all_raster_data, names, fingerprints, stack_path, header_path):
+    """Decode all rasters into the stack file and save the header"""
+
+    # an old header must not describe an incomplete stack
+    if os.path.exists(header_path):
+        os.remove(header_path)
+
+    with rasterio.open(path_rasters + all_raster_data[names[0]]['path']) as first:
+        header = {
+            'bands': names,
+            'fingerprints': fingerprints,
+            'width': first.width,
+            'height': first.height,
+            'transform': list(first.transform)[:6],
+            'crs': first.crs.to_wkt() if first.crs is not None else '',
+            'dtype': 'float32',
+        }
+        grid = {'crs': first.crs, 'transform': first.transform, 'width': first.width, 'height': first.height}
+    stack = np.memmap(stack_path, dtype='<f4', mode='w+', shape=(len(names), header['height'], header['width']))
+    for band, name in enumerate(names):
+        print('Adding ' + name + ' to the raster stack')
+        with rasterio.open(path_rasters + all_raster_data[name]['path']) as src:
+            # the stack is read with the same pixel indices for all rasters
+            differences = grid_differences(src, grid)
+            if differences:
+                raise ValueError('Raster ' + name + ' is not on the grid of ' + names[0] + ' (' + ', '.join(differences) + ')')
+            for window in chunk_windows(src):
+                values = unscale(src, src.read(1, window=window, masked=True)).astype(np.float32)
+                stack[band][window.toslices()] = values.filled(np.nan)
+    stack.flush()
+    del stack
+
+    with open(header_path, 'w') as header_file:
+        json.dump(header, header_file)
+    return header
+
+
+def _write_vrt(vrt_path, header, band):
+    """Save a VRT file that reads one band of the stack as raw raster"""
+
+    width = header['width']
+    height = header['height']
+    a, b, c, d, e, f = header['transform']
+    vrt = ('<VRTDataset rasterXSize="{width}" rasterYSize="{height}">\n'
+           '  <SRS>{crs}</SRS>\n'
+           '  <GeoTransform>{c!r}, {a!r}, {b!r}, {f!r}, {d!r}, {e!r}</GeoTransform>\n'
+           '  <Metadata>\n'
+           '    <MDI key="source_fingerprint">{fingerprint}</MDI>\n'
+           '  </Metadata>\n'
+           '  <VRTRasterBand dataType="Float32" band="1" subClass="VRTRawRasterBand">\n'
+           '    <NoDataValue>nan</NoDataValue>\n'
+           '    <SourceFilename relativetoVRT="1">stack.bsq</SourceFilename>\n'
+           '    <ImageOffset>{offset}</ImageOffset>\n'
+           '    <PixelOffset>4</PixelOffset>\n'
+           '    <LineOffset>{line_offset}</LineOffset>\n'
+           '    <ByteOrder>LSB</ByteOrder>\n'
+           '  </VRTRasterBand>\n'
+           '</VRTDataset>\n').format(
+        width=width, height=height, crs=escape(header['crs']), a=a, b=b, c=c, d=d, e=e, f=f,
+        fingerprint=header['fingerprints'][band], offset=band * height * width * 4, line_offset=width * 4)
+    # the file is only written if it changed, so its fingerprint stays the same
+    if os.path.exists(vrt_path):
+        with open(vrt_path) as vrt_file:
+            if vrt_file.read() == vrt:
+                return
+    with open(vrt_path, 'w') as vrt_file:
+        vrt_file.write(vrt)
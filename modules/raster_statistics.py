@@ -0,0 +1,103 @@
+"""
+raster_statistics.py<br>
+python 3.6.7<br>
+Definition of a function that returns global statistics of a raster, calculated once and then taken from a catalog<br>
+@author: Lisa Stubert<br>
+@date: 2019-05-30<br>
+"""
+
+import json
+import os
+
+import numpy as np
+import rasterio
+
+from modules.fingerprint import file_fingerprint
+from modules.output_rasters import unscale
+
+
+def raster_statistics(raster_path, cache_dir, bins=256):
+    """Global statistics of a raster
+
+    The statistics of all valid pixels (min, max, mean, standard deviation, count
+    and a histogram) are calculated by streaming over the blocks of the raster, so
+    the raster is never loaded completely. The result is stored in the catalog
+    directory as a JSON file named after the content hash of the raster. Every later
+    request for the same raster content, by any model, fold or stage, reads this
+    file instead of the raster.
+
+    Parameters
+    ----------
+    raster_path: str
+        Path to the raster
+    cache_dir: str
+        Directory of the catalog
+    bins: int
+        Number of histogram bins between min and max (default 256)
+
+    Returns
+    -------
+    statistics: dict
+        'min', 'max', 'mean', 'std' (population standard deviation), 'count',
+        'histogram' (counts per bin) and 'bin_edges'
+    """
+
+    fingerprint = file_fingerprint(raster_path, cache_dir)
+    catalog_path = os.path.join(cache_dir, fingerprint + '.json')
+    if os.path.exists(catalog_path):
+        with open(catalog_path) as catalog_file:
+            statistics = json.load(catalog_file)
+        if len(statistics['histogram']) == bins:
+            return statistics
+
+    print('Calculating statistics of ' + raster_path)
+    count = 0
+    mean = 0.0
+    sum_of_squares = 0.0
+    value_min = np.inf
+    value_max = -np.inf
+    with rasterio.open(raster_path) as src:
+        windows = [window for ij, window in src.block_windows(1)]
+        # first pass: min, max and moments, blocks are merged with the parallel algorithm of Chan et al.
+        for window in windows:
+            values = unscale(src, src.read(1, window=window, masked=True)).compressed().astype(float)
+            if len(values) == 0:
+                continue
+            block_count = len(values)
+            block_mean = values.mean()
+            block_sum_of_squares = ((values - block_mean) ** 2).sum()
+            delta = block_mean - mean
+            total = count + block_count
+            mean += delta * block_count / total
+            sum_of_squares += block_sum_of_squares + delta ** 2 * count * block_count / total
+            count = total
+            value_min = min(value_min, values.min())
+            value_max = max(value_max, values.max())
+
+        # second pass: histogram between min and max
+        histogram = np.zeros(bins, dtype=np.int64)
+        if count > 0:
+            bin_edges = np.linspace(value_min, value_max, bins + 1)
+            for window in windows:
+                values = unscale(src, src.read(1, window=window, masked=True)).compressed()
+                histogram += np.histogram(values, bins=bin_edges)[0]
+        else:
+            bin_edges = np.zeros(bins + 1)
+
+    if count == 0:
+        value_min = value_max = mean = std = float('nan')
+    else:
+        std = np.sqrt(sum_of_squares / count)
+    statistics = {
+        'min': float(value_min),
+        'max': float(value_max),
+        'mean': float(mean),
+        'std': float(std),
+        'count': int(count),
+        'histogram': histogram.tolist(),
+        'bin_edges': bin_edges.tolist(),
+    }
+    os.makedirs(cache_dir, exist_ok=True)
+    with open(catalog_path, 'w') as catalog_file:
+        json.dump(statistics, catalog_file)
+    return statistics
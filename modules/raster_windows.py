@@ -0,0 +1,67 @@
+"""
+raster_windows.py<br>
+python 3.6.7<br>
+Definition of a function that splits a raster in windows for block-wise processing<br>
+@author: Lisa Stubert<br>
+@date: 2019-05-30<br>
+"""
+
+from rasterio.windows import Window
+
+
+def chunk_windows(src, max_pixels=4194304):
+    """Split a raster in windows that follow its internal blocks
+
+    Tiled rasters are processed tile by tile. Rasters stored in strips (often only
+    one row high) are processed in bands of whole strips, with as many rows as fit
+    into max_pixels, so the number of reads stays small.
+
+    Parameters
+    ----------
+    src: rasterio dataset
+        Opened raster
+    max_pixels: int
+        Maximum number of pixels of a band of strips (default 4194304, 16 MB of float32)
+
+    Returns
+    -------
+    windows: list
+        Windows covering the raster without overlap, in row-major order
+    """
+
+    block_height, block_width = src.block_shapes[0]
+    if block_width < src.width:
+        # tiled raster, the tiles are the windows
+        return [window for ij, window in src.block_windows(1)]
+
+    # raster in strips, read bands of whole strips
+    return row_windows(src, max_pixels)
+
+
+def row_windows(src, max_pixels=4194304):
+    """Split a raster in bands of whole rows that follow its internal blocks
+
+    Every band has as many rows as fit into max_pixels, rounded down to whole
+    blocks. If not even one block fits, the bands are cut through the blocks (the
+    block cache of GDAL keeps the decoded blocks for the next band), but they have
+    at least one row. The pixels of a band are contiguous in the row-major order
+    of the raster.
+
+    Parameters
+    ----------
+    src: rasterio dataset
+        Opened raster
+    max_pixels: int
+        Maximum number of pixels of a band (default 4194304, 16 MB of float32)
+
+    Returns
+    -------
+    windows: list
+        Windows covering the raster without overlap, from top to bottom
+    """
+
+    block_height = src.block_shapes[0][0]
+    rows = max_pixels // src.width // block_height * block_height
+    if rows == 0:
+        rows = max(1, max_pixels // src.width)
+    return [Window(0, row, src.width, min(rows, src.height - row)) for row in range(0, src.height, rows)]
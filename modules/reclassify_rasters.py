@@ -1,20 +1,48 @@
 """ 
 reclassify_rasters.py<br>
 python 3.6.7<br>
-Definition of a function to get raster values within buffers<br>
+Definition of functions to reclassify the predictor variable rasters on the basis of their boxplot statistics<br>
 @author: Lisa Stubert<br>
 @date: 2019-05-30   <br>
 """
 
+import hashlib
+import os
+import threading
+
 import numpy as np
-import pandas as pd
-from osgeo import gdal
+import rasterio
+
+from modules.fingerprint import file_fingerprint
+from modules.raster_stack import read_window, stack_band
+from modules.raster_windows import chunk_windows
+from modules.memory_budget import chunk_pixels
+from modules.output_rasters import creation_options
+from modules.tile_pool import map_tiles, prefetch, raster_handles, thread_count
+
+# class code of pixels without data in the reclassified rasters
+CLASS_NODATA = 255
 
 
-def reclassify_rasters(working_dir, raster_data, result_name, df_boxplot_statistics):
+def reclassify_rasters(working_dir, raster_data, result_name, df_boxplot_statistics, cache_dir=None, max_cache_entries=200, threads=None, memory_budget=None, read_ahead=2, compress='deflate'):
     """Reclassify rasters
 
     This script reclassifies whole rasters based on their boxplot statistics. The result is a new reclassified raster for every read raster.
+    The rasters are processed window by window in a single pass, so the memory
+    needed depends on the tile size of the class rasters, not on their size. The
+    windows are the tiles of the class raster, split into one group of
+    neighbouring windows per thread of a thread pool. Every thread reads the next
+    windows of its group in the background while the current one is reclassified
+    (see prefetch), and the windows are written one at a time. The classes 0, 1
+    and 2 are saved as tiled and compressed uint8 (see creation_options), pixels
+    without data get the class CLASS_NODATA (255).
+
+    If a cache directory is given, the class rasters are saved there under a key
+    made of the content of the raster, its type (distance or other) and the
+    threshold values. A class raster with the same key is reused instead of being
+    calculated again, e.g. by models with another weighting or in later runs.
+    The path of the class raster of every raster is saved in
+    raster_data[item]['reclassified'].
 
     Parameters
     ----------
@@ -24,15 +52,39 @@ def reclassify_rasters(working_dir, raster_data, result_name, df_boxplot_statist
         Names and paths of the predictore variable rasters
     result_name: str
         Name of the model
+    df_boxplot_statistics: dataframe
+        Contains calculated boxplot statistics of the rasters
+    cache_dir: str
+        Directory of the cache of class rasters (default None: no cache)
+    max_cache_entries: int
+        Maximum number of class rasters kept in the cache, the least recently
+        used ones are deleted first
+    threads: int
+        Number of threads (default None: one per processor core)
+    memory_budget: float
+        Memory budget in MB, the windows of all threads fit into it (default None: no budget)
+    read_ahead: int
+        Number of windows every thread reads ahead in the background (default 2, 0 to
+        read them one after the other)
+    compress: str
+        Compression of the class rasters: 'deflate', 'zstd', 'lzw' or None (default 'deflate')
 
     Note
     ----
-    This is the third function called by the run_model.py script. It needs the output from the function 'boxplots', a Excelsheet located in working_dir + 'results/statistics/'.
-    The output file is saved as follows.
+    This is the third function called by the run_model.py script if the option class_rasters is True. It needs the boxplot statistics returned by the function 'boxplots' (df_boxplot_statistics).
+    The output files are saved as follows.
+
+    Type: Rasters tif (uint8, classes 0, 1, 2 and CLASS_NODATA)
+    File location: cache_dir (working_dir + 'tmp/reclass_cache/' in run_modelling.py)
+    File name: key of the raster and its thresholds (see _cache_key)
 
-    Type: Rasters tif
-    File location: working_dir + tmp + '/reclassified/'
+    Without a cache directory:
+
+    Type: Rasters tif (uint8, classes 0, 1, 2 and CLASS_NODATA)
+    File location: working_dir + 'tmp/reclassified/'
     File name: raster_name + '_reclassified' + result_name
+
+    With a cache the file location is cache_dir and the file name is the key.
     """
 
     # set path the rasterdata
@@ -42,49 +94,153 @@ def reclassify_rasters(working_dir, raster_data, result_name, df_boxplot_statist
 
     # loop over dictionairy with rasters
     for item in raster_data:
-        # load raster
-        driver = gdal.GetDriverByName('GTiff')
-        raster = gdal.Open(path_rasters + raster_data[item]['path'])
-        band = raster.GetRasterBand(1)
-        raster_array = band.ReadAsArray()
-        nodata = band.GetNoDataValue()
-        if nodata is not None:
-            raster_array = np.ma.masked_equal(raster_array, nodata)
-        # copy the raster, not to get problems by reclassifying overwritten values
-        raster_array_reclass = raster_array.copy()
-
-        # reclassification
         print('Reclassifying ' + item)
         # the values for the reclassification conditions are taken out of the statistics table
+        thresholds, lookup = class_thresholds(item, df[item])
         if 'e_' in item or 'c_' in item:
-            raster_array_reclass[np.where(
-                raster_array > df[item]['upper_quartile75'])] = 0
-            raster_array_reclass[np.where(
-                raster_array <= df[item]['median'])] = 2
-            raster_array_reclass[np.where((df[item]['median'] < raster_array) & (raster_array <= df[item]['upper_quartile75']))] = 1
             print('distance detected')
 
+        raster_path = path_rasters + raster_data[item]['path']
+        if cache_dir is None:
+            reclassified_path = working_dir + 'tmp/reclassified/' + item + '_reclassified' + result_name + '.tif'
         else:
-            raster_array_reclass[np.where(raster_array > df[item]['upper_percentile87.5'])] = 0
-            raster_array_reclass[np.where(raster_array < df[item]['lower_percentile12.5'])] = 0
-            raster_array_reclass[np.where((df[item]['lower_quartile25'] <= raster_array) 
-                            & (raster_array <= df[item]['upper_quartile75']))] = 2
-            raster_array_reclass[np.where((df[item]['lower_quartile25'] > raster_array)
-                            & (raster_array >= df[item]['lower_percentile12.5']))] = 1
-            raster_array_reclass[np.where((df[item]['upper_quartile75'] < raster_array)
-                            & (raster_array <= df[item]['upper_percentile87.5']))] = 1
-
-        # create new raster
-        raster_reclass = driver.Create(working_dir + 'tmp/reclassified/' + item + '_reclassified' + result_name + '.tif', raster.RasterXSize, raster.RasterYSize, 1)
-        outband = raster_reclass.GetRasterBand(1)
-        outband.SetNoDataValue(-9999)
-        outband.WriteArray(raster_array_reclass)
-        #raster_reclass.GetRasterBand(1).WriteArray(raster_array_reclass)
-        # get and set the spatial ref system
-        proj = raster.GetProjection()
-        georef = raster.GetGeoTransform()
-        raster_reclass.SetProjection(proj)
-        raster_reclass.SetGeoTransform(georef) 
-        # clear variable
-        raster_reclass = None
+            key = _cache_key(file_fingerprint(raster_path, cache_dir), lookup, thresholds)
+            reclassified_path = os.path.join(cache_dir, key + '.tif')
+            if os.path.exists(reclassified_path):
+                print('Class raster taken from cache')
+                # mark it as recently used
+                os.utime(reclassified_path)
+                raster_data[item]['reclassified'] = reclassified_path
+                continue
+            os.makedirs(cache_dir, exist_ok=True)
+
+        # write to a temporary file first, so no incomplete class raster is left in the cache
+        temporary_path = reclassified_path[:-len('.tif')] + '_incomplete.tif'
+        with rasterio.open(raster_path) as src:
+            profile = {'driver': 'GTiff', 'width': src.width, 'height': src.height, 'count': 1, 'dtype': 'uint8',
+                       'crs': src.crs, 'transform': src.transform, 'nodata': CLASS_NODATA}
+        profile.update(creation_options('uint8', compress))
+        # rasters of the raster stack are read from its memory map
+        band = stack_band(raster_data[item])
+        write_lock = threading.Lock()
+        with rasterio.open(temporary_path, 'w', **profile) as dst, raster_handles([raster_path], threads) as handles:
+            # the windows are the tiles of the class raster, so every tile is written and compressed once
+            # memory per pixel of a window: values read, their validity, digitized indices and classes,
+            # and the windows read ahead by every thread
+            windows = chunk_windows(dst, chunk_pixels(memory_budget, 8 + 1 + 16 + 1 + 9 * read_ahead,
+                                                      thread_count(threads)))
+            # one group of neighbouring windows per thread
+            groups = min(thread_count(threads), len(windows))
+            window_groups = [windows[len(windows) * i // groups:len(windows) * (i + 1) // groups]
+                             for i in range(groups)]
+
+            def reclassify_group(group):
+                """Read and reclassify the windows of one group with the opened raster of this thread and write them"""
+
+                sources = handles.get()
+                try:
+                    # the next windows are read while the current one is reclassified and written
+                    read = lambda window: read_window(sources[0], band, window)
+                    for window, values in prefetch(read, group, read_ahead):
+                        classes = reclassify_block(values, thresholds, lookup)
+                        # only one thread at a time writes to the class raster
+                        with write_lock:
+                            dst.write(classes, 1, window=window)
+                finally:
+                    handles.put(sources)
+
+            # the groups of windows are read and reclassified concurrently
+            map_tiles(reclassify_group, window_groups, threads)
+        os.replace(temporary_path, reclassified_path)
+        raster_data[item]['reclassified'] = reclassified_path
+
+    if cache_dir is not None:
+        _evict(cache_dir, max_cache_entries)
     print('Reclassification of raster values finished\n')
+
+
+def _cache_key(fingerprint, lookup, thresholds):
+    """Key of a class raster: raster content, type of reclassification and threshold values"""
+
+    if lookup.ndim == 1:
+        description = fingerprint + ';distance'
+    else:
+        description = fingerprint + ';other'
+    for bins, right in thresholds:
+        description += ';' + ','.join(repr(float(value)) for value in bins)
+    return hashlib.sha1(description.encode()).hexdigest()
+
+
+def _evict(cache_dir, max_cache_entries):
+    """Delete the least recently used class rasters if the cache holds too many"""
+
+    paths = [os.path.join(cache_dir, name) for name in os.listdir(cache_dir)
+             if name.endswith('.tif') and not name.endswith('_incomplete.tif')]
+    if len(paths) > max_cache_entries:
+        paths.sort(key=os.path.getmtime)
+        for old_path in paths[:len(paths) - max_cache_entries]:
+            os.remove(old_path)
+
+
+def class_thresholds(item, statistics):
+    """Thresholds and class lookup table of the reclassification of a raster
+
+    Cost distances and other distances (names containing 'c_' or 'e_'):
+    values above the upper quartile get class 0, values up to the median class 2
+    and values in between class 1.
+
+    Other rasters: values between the quartiles get class 2, values between the
+    quartiles and the 12.5th or 87.5th percentile class 1 and values outside of
+    these percentiles class 0.
+
+    Parameters
+    ----------
+    item: str
+        Name of the raster
+    statistics: series
+        Boxplot statistics of the raster
+
+    Returns
+    -------
+    thresholds: list
+        Pairs of bins and right for np.digitize, one pair per threshold side
+    lookup: array
+        Class for every combination of the digitized indices
+    """
+
+    if 'e_' in item or 'c_' in item:
+        thresholds = [([statistics['median'], statistics['upper_quartile75']], True)]
+        lookup = np.array([2, 1, 0], dtype=np.uint8)
+    else:
+        # lower side: < p12.5, [p12.5, q25), >= q25; upper side: <= q75, (q75, p87.5], > p87.5
+        thresholds = [([statistics['lower_percentile12.5'], statistics['lower_quartile25']], False),
+                      ([statistics['upper_quartile75'], statistics['upper_percentile87.5']], True)]
+        lookup = np.array([[0, 0, 0],
+                           [1, 1, 1],
+                           [2, 1, 0]], dtype=np.uint8)
+    return thresholds, lookup
+
+
+def reclassify_block(values, thresholds, lookup):
+    """Reclassify a block of raster values
+
+    Parameters
+    ----------
+    values: masked array
+        Raster values, masked where the raster has no data
+    thresholds: list
+        Thresholds returned by class_thresholds
+    lookup: array
+        Lookup table returned by class_thresholds
+
+    Returns
+    -------
+    classes: array
+        Classes as uint8, CLASS_NODATA where the raster has no data
+    """
+
+    data = np.ma.getdata(values)
+    valid = ~np.ma.getmaskarray(values) & np.isfinite(data)
+    classes = lookup[tuple(np.digitize(data, bins, right=right) for bins, right in thresholds)]
+    classes[~valid] = CLASS_NODATA
+    return classes
@@ -0,0 +1,266 @@
+"""
+resample_mask.py<br>
+python 3.6.7<br>
+Definition of functions to resample the suitability to the buffer size and to cut it with a cached mask<br>
+@author: Lisa Stubert<br>
+@date: 2019-05-30<br>
+"""
+
+import hashlib
+import math
+import os
+
+import numpy as np
+import geopandas as gpd
+import rasterio
+from affine import Affine
+from rasterio.features import geometry_mask
+
+from modules.fingerprint import file_fingerprint
+from modules.memory_budget import accumulator
+
+
+def resampled_grid(transform, width, height, resolution):
+    """Grid of a raster resampled to another pixel size
+
+    Like gdalwarp -tr, the grid starts at the upper left corner of the raster and
+    has as many pixels as fit into its extent, rounded to the nearest number.
+
+    Parameters
+    ----------
+    transform: Affine
+        Transform of the raster
+    width: int
+    height: int
+    resolution: float
+        New pixel size
+
+    Returns
+    -------
+    transform: Affine
+        Transform of the resampled raster
+    width: int
+    height: int
+    """
+
+    resolution = float(resolution)
+    new_width = int((width * transform.a + resolution / 2) / resolution)
+    new_height = int((height * abs(transform.e) + resolution / 2) / resolution)
+    new_transform = Affine(resolution, 0, transform.c, 0, -resolution, transform.f)
+    return new_transform, new_width, new_height
+
+
+def nearest_indices(transform, width, height, new_transform, new_width, new_height):
+    """Rows and columns of the pixels of a raster that are nearest to the pixel centers of another grid
+
+    Parameters
+    ----------
+    transform: Affine
+        Transform of the raster
+    width: int
+    height: int
+    new_transform: Affine
+        Transform of the other grid
+    new_width: int
+    new_height: int
+
+    Returns
+    -------
+    rows: array
+        Row of the raster for every row of the grid, -1 outside of the raster
+    cols: array
+        Column of the raster for every column of the grid, -1 outside of the raster
+    """
+
+    x = new_transform.c + (np.arange(new_width) + 0.5) * new_transform.a
+    y = new_transform.f + (np.arange(new_height) + 0.5) * new_transform.e
+    cols = np.floor((x - transform.c) / transform.a).astype(np.int64)
+    rows = np.floor((y - transform.f) / transform.e).astype(np.int64)
+    cols[(cols < 0) | (cols >= width)] = -1
+    rows[(rows < 0) | (rows >= height)] = -1
+    return rows, cols
+
+
+def resample_nearest(array, transform, resolution):
+    """Resample an array to another pixel size by nearest neighbour
+
+    Parameters
+    ----------
+    array: array
+        Raster values, NaN where there is no data
+    transform: Affine
+        Transform of the array
+    resolution: float
+        New pixel size
+
+    Returns
+    -------
+    resampled: array
+        Resampled values, NaN where there is no data
+    transform: Affine
+        Transform of the resampled array
+    """
+
+    new_transform, new_width, new_height = resampled_grid(transform, array.shape[1], array.shape[0], resolution)
+    rows, cols = nearest_indices(transform, array.shape[1], array.shape[0], new_transform, new_width, new_height)
+    resampled = array[np.ix_(rows, cols)].astype(float)
+    resampled[rows < 0, :] = np.nan
+    resampled[:, cols < 0] = np.nan
+    return resampled, new_transform
+
+
+def mask_and_crop(array, transform, crs, mask_path, cache_dir=None, memory_budget=None, temporary_dir=None):
+    """Cut an array with the polygons of a mask shapefile
+
+    Like gdalwarp -cutline -crop_to_cutline, the array is cropped to the extent
+    of the mask, aligned outward to the pixels of the array, and pixels with their
+    center outside of the polygons get no data. The rasterized mask is taken from
+    cutline_mask, so it is calculated only once per grid if a cache directory is given.
+
+    Parameters
+    ----------
+    array: array
+        Raster values, NaN where there is no data
+    transform: Affine
+        Transform of the array
+    crs: CRS
+        Coordinate reference system of the array
+    mask_path: str
+        Path to the shapefile with the polygons to keep
+    cache_dir: str
+        Directory of the cache of rasterized masks (default None: no cache, the mask is rasterized every time)
+    memory_budget: float
+        Memory budget in MB, the cropped values are kept on disk if they do not
+        fit into it (default None: no budget, see accumulator)
+    temporary_dir: str
+        Directory of cropped values kept on disk
+
+    Returns
+    -------
+    cut: array
+        Cropped values, NaN outside of the mask and where there is no data
+    transform: Affine
+        Transform of the cropped array
+    """
+
+    left, bottom, right, top = mask_bounds(mask_path, crs, cache_dir)
+
+    # extent of the mask in pixels of the array, aligned outward
+    col_start = int(math.floor((left - transform.c) / transform.a))
+    col_stop = int(math.ceil((right - transform.c) / transform.a))
+    row_start = int(math.floor((top - transform.f) / transform.e))
+    row_stop = int(math.ceil((bottom - transform.f) / transform.e))
+    cut_transform = transform * Affine.translation(col_start, row_start)
+
+    # copy the part of the array inside the extent, the rest stays without data
+    cut = accumulator((row_stop - row_start, col_stop - col_start), memory_budget, temporary_dir)
+    rows = slice(max(row_start, 0), min(row_stop, array.shape[0]))
+    cols = slice(max(col_start, 0), min(col_stop, array.shape[1]))
+    if rows.start < rows.stop and cols.start < cols.stop:
+        cut[rows.start - row_start:rows.stop - row_start, cols.start - col_start:cols.stop - col_start] = array[rows, cols]
+
+    # pixels with their center outside of the polygons get no data
+    inside = cutline_mask(mask_path, cut_transform, cut.shape[1], cut.shape[0], crs, cache_dir)
+    cut[~inside] = np.nan
+    return cut, cut_transform
+
+
+def cutline_mask(mask_path, transform, width, height, crs, cache_dir=None):
+    """Rasterized mask of the polygons of a shapefile
+
+    The mask is calculated once per mask file and grid. If a cache directory is
+    given, it is saved there as packed bits (np.packbits), so later models and
+    runs with the same grid only load and unpack it. Nothing is kept in memory
+    between calls.
+
+    Parameters
+    ----------
+    mask_path: str
+        Path to the shapefile with the polygons to keep
+    transform: Affine
+        Transform of the grid
+    width: int
+    height: int
+    crs: CRS
+        Coordinate reference system of the grid
+    cache_dir: str
+        Directory of the cache of rasterized masks (default None: no cache, the mask is rasterized every time)
+
+    Returns
+    -------
+    inside: array
+        Boolean array of the grid, True where the pixel center is inside of the polygons
+    """
+
+    key = _mask_key(mask_path, crs, cache_dir, tuple(transform)[:6], width, height)
+
+    def rasterize_mask():
+        mask = _read_mask(mask_path, crs)
+        inside = ~geometry_mask(mask.geometry, out_shape=(height, width), transform=transform, all_touched=False)
+        return {'packed': np.packbits(inside)}
+
+    packed = _cached_arrays(cache_dir, key, rasterize_mask)['packed']
+    return np.unpackbits(packed, count=width * height).reshape(height, width).astype(bool)
+
+
+def mask_bounds(mask_path, crs, cache_dir=None):
+    """Extent of the polygons of a mask shapefile, calculated once per mask file
+
+    Parameters
+    ----------
+    mask_path: str
+        Path to the shapefile
+    crs: CRS
+        Coordinate reference system of the extent
+    cache_dir: str
+        Directory of the cache of rasterized masks (default None: no cache, the mask is rasterized every time)
+
+    Returns
+    -------
+    bounds: array
+        left, bottom, right, top
+    """
+
+    key = _mask_key(mask_path, crs, cache_dir, 'bounds')
+    return _cached_arrays(cache_dir, key, lambda: {'bounds': _read_mask(mask_path, crs).total_bounds})['bounds']
+
+
+def _read_mask(mask_path, crs):
+    """Read the mask shapefile in the coordinate reference system of the grid"""
+
+    mask = gpd.read_file(mask_path)
+    if crs is not None and mask.crs is not None and mask.crs != crs:
+        mask = mask.to_crs(crs)
+    return mask
+
+
+def _mask_key(mask_path, crs, cache_dir, *grid):
+    """Key of a mask: content of the files of the shapefile, coordinate reference system and grid"""
+
+    description = ''
+    for extension in ('.shp', '.shx', '.dbf', '.prj'):
+        path = os.path.splitext(mask_path)[0] + extension
+        if os.path.exists(path):
+            description += file_fingerprint(path, cache_dir) + ';'
+    if crs is not None:
+        description += str(crs.to_wkt()) + ';'
+    description += repr(grid)
+    return hashlib.sha1(description.encode()).hexdigest()
+
+
+def _cached_arrays(cache_dir, key, calculate):
+    """Arrays saved under a key in the cache, calculated with calculate() if they are not in it"""
+
+    cache_path = None
+    if cache_dir is not None:
+        cache_path = os.path.join(cache_dir, key + '.npz')
+    if cache_path is not None and os.path.exists(cache_path):
+        with np.load(cache_path) as cached:
+            arrays = dict(cached)
+    else:
+        arrays = calculate()
+        if cache_path is not None:
+            os.makedirs(cache_dir, exist_ok=True)
+            np.savez(cache_path, **arrays)
+    return arrays
+
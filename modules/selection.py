@@ -0,0 +1,169 @@
+"""
+selection.py<br>
+python 3.6.7<br>
+Definition of functions for the correlation-constrained selection of predictor variables<br>
+@author: Lisa Stubert<br>
+@date: 2019-05-30<br>
+"""
+
+import numpy as np
+
+
+def select_predictors(df_boxplot_statistics, correlation_matrix, statistic_threshold, corr_threshold, statistic_threshold_type):
+    """Select predictor variables by ranking and correlation
+
+    Cost distances (names starting with c_, except c_slop+asp) are always
+    selected. The other variables are ranked by the statistic (ascending for
+    iqr_norm, descending for w2). Variables are taken from the ranking until the
+    statistic threshold is reached. Then all pairs of selected variables with a
+    Pearson correlation above the correlation threshold are checked in the order
+    of the correlation matrix, and the variable with the worse statistic is
+    removed. This is repeated with the next variables of the ranking until enough
+    variables are selected or the ranking is used up. Removed variables never come
+    back.
+
+    The correlations are held as a boolean conflict matrix and the selection as a
+    boolean mask, so only the rows with a conflict among the selected variables
+    are visited. This keeps the selection fast for hundreds of candidates.
+
+    Parameters
+    ----------
+    df_boxplot_statistics: dataframe
+        Contains calculated boxplot statistics, one column per predictor variable
+    correlation_matrix: dataframe
+        Pearson correlation values of the predictor variables
+    statistic_threshold: int
+        Number of variables to select, besides the cost distances
+    corr_threshold: float
+        Highest absolute correlation allowed between two selected variables
+    statistic_threshold_type: str
+        'iqr_norm' or 'w2'
+
+    Returns
+    -------
+    selection_list: list
+        Selected variables in the order they were added, without cost distances
+    cost_distance_list: list
+        Cost distances, which are always used
+    """
+
+    selections = select_predictors_grid(
+        df_boxplot_statistics, correlation_matrix, [statistic_threshold], [corr_threshold], [statistic_threshold_type])
+    return selections[(statistic_threshold, corr_threshold, statistic_threshold_type)]
+
+
+def select_predictors_grid(df_boxplot_statistics, correlation_matrix, statistic_thresholds, corr_thresholds, statistic_threshold_types):
+    """Select predictor variables for a whole grid of thresholds
+
+    The ranking of every statistic type and the conflict matrix of every
+    correlation threshold are calculated once and shared by all grid points. Only
+    the greedy selection itself (see select_predictors) runs per grid point.
+
+    Parameters
+    ----------
+    df_boxplot_statistics: dataframe
+        Contains calculated boxplot statistics, one column per predictor variable
+    correlation_matrix: dataframe
+        Pearson correlation values of the predictor variables
+    statistic_thresholds: list
+        Numbers of variables to select, besides the cost distances
+    corr_thresholds: list
+        Highest absolute correlations allowed between two selected variables
+    statistic_threshold_types: list
+        'iqr_norm' and/or 'w2'
+
+    Returns
+    -------
+    selections: dict
+        For every grid point (statistic_threshold, corr_threshold, statistic_threshold_type)
+        a tuple of the selection_list and the cost_distance_list
+    """
+
+    names = list(correlation_matrix.columns)
+    # pairs of variables with a higher correlation than the threshold, upper triangle without diagonal
+    correlation = np.abs(correlation_matrix.values.astype(float))
+    conflicts = {}
+    for corr_threshold in corr_thresholds:
+        conflicts[corr_threshold] = np.triu(
+            np.where(np.isnan(correlation), False, correlation > corr_threshold), k=1)
+
+    selections = {}
+    for statistic_threshold_type in statistic_threshold_types:
+        statistic = df_boxplot_statistics.loc[statistic_threshold_type, names].values.astype(float)
+        # True if the statistic of the first variable is better than that of the second one
+        if statistic_threshold_type == 'w2':
+            better = statistic[:, None] > statistic[None, :]
+            ranking = np.argsort(-statistic, kind='mergesort')
+        else:
+            better = statistic[:, None] < statistic[None, :]
+            ranking = np.argsort(statistic, kind='mergesort')
+
+        cost_distance_list = []
+        candidates = []
+        for i in ranking:
+            if names[i].startswith('c_') and names[i] != 'c_slop+asp':
+                print(names[i] + ' distance detected and added as predictor variable')
+                cost_distance_list.append(names[i])
+            else:
+                candidates.append(i)
+
+        for statistic_threshold in statistic_thresholds:
+            for corr_threshold in corr_thresholds:
+                selection_list = _greedy_selection(
+                    names, candidates, better, conflicts[corr_threshold], statistic_threshold)
+                selections[(statistic_threshold, corr_threshold, statistic_threshold_type)] = (
+                    selection_list, list(cost_distance_list))
+    return selections
+
+
+def _greedy_selection(names, candidates, better, conflict, statistic_threshold):
+    """Take variables from the ranking and remove correlated ones until enough are selected
+
+    Parameters
+    ----------
+    names: list
+        Names of the variables, in the order of the correlation matrix
+    candidates: list
+        Positions of the variables that can be selected, in the order of the ranking
+    better: array
+        True if the statistic of the row variable is better than that of the column variable
+    conflict: array
+        True for pairs of variables that are too highly correlated, upper triangle
+    statistic_threshold: int
+        Number of variables to select
+
+    Returns
+    -------
+    selection_list: list
+        Selected variables in the order they were added
+    """
+
+    selected = np.zeros(len(names), dtype=bool)
+    added = []
+    next_candidate = 0
+    while selected.sum() < statistic_threshold:
+        if next_candidate == len(candidates):
+            break
+        # take the next variables of the ranking
+        while selected.sum() < statistic_threshold and next_candidate < len(candidates):
+            i = candidates[next_candidate]
+            next_candidate += 1
+            selected[i] = True
+            added.append(i)
+            print('Add predictor variable' + names[i])
+
+        # check for correlations, row by row in the order of the correlation matrix
+        for row in np.flatnonzero(selected & (conflict & selected).any(axis=1)):
+            if not selected[row]:
+                continue
+            for col in np.flatnonzero(conflict[row] & selected):
+                # if it is higher, the variable with the worse statistic will be deleted
+                if better[row, col]:
+                    selected[col] = False
+                    print('Remove variable ' + names[col] + ' because of high correlation with ' + names[row])
+                else:
+                    selected[row] = False
+                    print('Remove variable ' + names[row] + ' because of high correlation with ' + names[col])
+                    break
+
+    return [names[i] for i in added if selected[i]]
@@ -0,0 +1,104 @@
+"""
+site_sampler.py<br>
+python 3.6.7<br>
+Definition of a function to sample the suitability at the sites, shared by the gain and the validation<br>
+@author: Lisa Stubert<br>
+@date: 2019-05-30<br>
+"""
+
+import numpy as np
+import pandas as pd
+import rasterio
+from rasterio.windows import Window
+
+from modules.raster_stack import read_window
+from modules.resample_mask import cutline_mask
+
+
+def sample_sites(raster_path, geometries, radius=5, mask_path=None, mask_cache_dir=None):
+    """Mean of the pixels of a raster that touch a small circle around every site
+
+    The raster is opened once. The centroids of all sites are converted to pixel
+    coordinates in one step, and the pixels that touch the circle of every site
+    are found with array operations: a pixel touches the circle if the distance
+    between the centroid and the rectangle of the pixel is smaller than the
+    radius (like rasterizing the buffer of the centroid with all_touched=True).
+    Only the blocks of the raster that hold such pixels are read, and the values
+    are gathered by indexing and averaged per site with np.bincount.
+
+    Parameters
+    ----------
+    raster_path: str
+        Path to the raster, e.g. a suitability result (north-up, the scale and
+        offset of the raster are applied)
+    geometries: list
+        Shapely geometries of the sites, their centroids are used
+    radius: float
+        Radius of the circle around every site in units of the coordinate reference system (default 5)
+    mask_path: str
+        Path to a shapefile with the polygons to keep, pixels outside of it are
+        not used (default None: no mask)
+    mask_cache_dir: str
+        Directory of the cache of rasterized masks (default None: no cache, the mask is rasterized every time)
+
+    Returns
+    -------
+    samples: dataframe
+        'x' and 'y' of the centroid and 'suitability_value' (NaN if no pixel
+        with data touches the circle) of every site, in the order of geometries
+    """
+
+    x = np.array([geometry.centroid.x for geometry in geometries], dtype=float)
+    y = np.array([geometry.centroid.y for geometry in geometries], dtype=float)
+
+    with rasterio.open(raster_path) as src:
+        inside = None
+        if mask_path is not None:
+            inside = cutline_mask(mask_path, src.transform, src.width, src.height, src.crs, mask_cache_dir)
+        pixel_width = abs(src.transform.a)
+        pixel_height = abs(src.transform.e)
+        # position of the centroids in pixels, the integer part is the pixel
+        col_position, row_position = ~src.transform * (x, y)
+        col_position = np.asarray(col_position, dtype=float)
+        row_position = np.asarray(row_position, dtype=float)
+
+        # candidate pixels: the same small square of pixels around every site
+        cols = np.floor(col_position - radius / pixel_width).astype(np.int64)[:, None, None] + \
+            np.arange(int(np.ceil(2 * radius / pixel_width)) + 1)[None, None, :]
+        rows = np.floor(row_position - radius / pixel_height).astype(np.int64)[:, None, None] + \
+            np.arange(int(np.ceil(2 * radius / pixel_height)) + 1)[None, :, None]
+        rows, cols = np.broadcast_arrays(rows, cols)
+        # distance between the centroid and the rectangle of every pixel
+        dx = np.maximum(np.maximum(cols - col_position[:, None, None], col_position[:, None, None] - (cols + 1)), 0)
+        dy = np.maximum(np.maximum(rows - row_position[:, None, None], row_position[:, None, None] - (rows + 1)), 0)
+        touched = ((dx * pixel_width) ** 2 + (dy * pixel_height) ** 2 < radius ** 2) & \
+            (cols >= 0) & (cols < src.width) & (rows >= 0) & (rows < src.height)
+        site, row, col = np.nonzero(touched)[0], rows[touched], cols[touched]
+
+        # read every block with touched pixels once, the pixels are sorted by block
+        block_height, block_width = src.block_shapes[0]
+        blocks_across = (src.width + block_width - 1) // block_width
+        block = (row // block_height) * blocks_across + col // block_width
+        order = np.argsort(block, kind='stable')
+        site, row, col, block = site[order], row[order], col[order], block[order]
+        values = np.full(len(block), np.nan)
+        starts = np.flatnonzero(np.diff(block, prepend=-1))
+        for start, stop in zip(starts, np.append(starts[1:], len(block))):
+            row_off = int(block[start] // blocks_across) * block_height
+            col_off = int(block[start] % blocks_across) * block_width
+            window = Window(col_off, row_off, min(block_width, src.width - col_off),
+                            min(block_height, src.height - row_off))
+            data = read_window(src, None, window)
+            valid = ~np.ma.getmaskarray(data) & np.isfinite(np.ma.getdata(data))
+            if inside is not None:
+                valid &= inside[row_off:row_off + window.height, col_off:col_off + window.width]
+            values[start:stop] = np.where(valid, np.ma.getdata(data), np.nan)[row[start:stop] - row_off,
+                                                                              col[start:stop] - col_off]
+
+    # mean of the pixels with data of every site
+    counted = ~np.isnan(values)
+    value_sum = np.bincount(site[counted], values[counted], minlength=len(x))
+    value_count = np.bincount(site[counted], minlength=len(x))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = np.where(value_count > 0, value_sum / value_count, np.nan)
+    return pd.DataFrame({'x': x, 'y': y, 'suitability_value': mean})
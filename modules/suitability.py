@@ -0,0 +1,198 @@
+"""
+suitability.py<br>
+python 3.6.7<br>
+Definition of functions that calculate the suitability directly from the predictor variable rasters or their classes<br>
+@author: Lisa Stubert<br>
+@date: 2019-05-30<br>
+"""
+
+import numpy as np
+
+from modules.memory_budget import accumulator, chunk_pixels
+from modules.raster_stack import stack_band
+from modules.reclassify_rasters import class_thresholds, reclassify_block
+from modules.resample_mask import nearest_indices, resampled_grid
+from modules.tile_pool import map_tiles, prefetch, raster_handles, thread_count
+from modules.valid_pixels import grid_positions, pixel_vector, row_bands, valid_pixels
+
+
+def suitability(working_dir, raster_data, df_boxplot_statistics, weights, resolution, threads=None, memory_budget=None,
+                read_ahead=2):
+    """Reclassify, weight and add up the predictor variable rasters in one pass, resampled to another pixel size
+
+    In every band of rows (see weighted_sum) the values of every raster are
+    reclassified with the thresholds of the boxplot statistics (like
+    reclassify_rasters), so no class raster is saved.
+
+    Parameters
+    ----------
+    working_dir: str
+        Working directory
+    raster_data: dict
+        Names and paths of the predictor variable rasters, all on the same grid
+    df_boxplot_statistics: dataframe
+        Contains calculated boxplot statistics of the rasters
+    weights: dict
+        For every weighting (e.g. 'w1') a dict with the weighting factor of every raster
+    resolution: str or float
+        Pixel size of the result
+    threads: int
+        Number of threads (default None: one per processor core)
+    memory_budget: float
+        Memory budget in MB (default None: no budget)
+    read_ahead: int
+        Number of rasters read ahead in the background (default 2, see prefetch)
+
+    Returns
+    -------
+    suitability_values: dict
+        For every weighting the normalized suitability, NaN where any of the rasters has no data
+    transform: Affine
+        Transform of the result
+    crs: CRS
+        Coordinate reference system of the rasters
+    """
+
+    path_rasters = working_dir + "data/"
+    items = list(raster_data)
+    # the values for the reclassification conditions are taken out of the statistics table
+    classifications = []
+    for item in items:
+        thresholds, lookup = class_thresholds(item, df_boxplot_statistics[item])
+        classifications.append(lambda values, thresholds=thresholds, lookup=lookup: reclassify_block(values, thresholds, lookup))
+
+    paths = [path_rasters + raster_data[item]['path'] for item in items]
+    # rasters of the raster stack are read from its memory map
+    bands = [stack_band(raster_data[item]) for item in items]
+    return weighted_sum(items, paths, bands, classifications, weights, resolution, threads, memory_budget,
+                        working_dir + 'tmp/', read_ahead)
+
+
+def weighted_sum(items, paths, bands, classifications, weights, resolution, threads=None, memory_budget=None,
+                 temporary_dir=None, read_ahead=2):
+    """Weight, add up and normalize the classes of rasters, resampled to another pixel size
+
+    The pixels where all rasters have data are found once (see valid_pixels), and
+    every raster is held as a dense vector of its values at these pixels, so
+    pixels without data are never classified or added up. The rasters are read
+    in bands of whole rows. The classes are multiplied with the weighting factors
+    of all weightings (one row of sums per weighting), so the suitability sums of
+    all weightings are calculated from the same classes. Only the sums at the
+    pixels nearest to the pixel centers of the resampled grid (see resampled_grid)
+    are put into the result.
+
+    The bands are processed concurrently on a thread pool (see map_tiles), every
+    thread with its own opened rasters. Within a band the next rasters are read
+    in the background while the current one is classified and added (see
+    prefetch). The normalization is a reduction in two
+    phases: every band returns the highest and lowest sum of every weighting, and
+    after all bands are done these are reduced to the extremes of the whole grid.
+    Then the sums are divided by the highest sum of all valid pixels of the
+    weighting.
+
+    The sums of a band are calculated in float64. The height of the bands is
+    chosen so the bands of all threads stay within half of the memory budget. The
+    results are float32, like the saved rasters, if float64 does not fit into the
+    budget, and kept on disk if they still do not fit (see accumulator).
+
+    Parameters
+    ----------
+    items: list
+        Names of the rasters
+    paths: list
+        Paths to the rasters, all on the same grid
+    bands: list
+        Memory map of every raster returned by stack_band, or None
+    classifications: list
+        Function for every raster that turns a vector of its values into classes,
+        None if the values are already classes
+    weights: dict
+        For every weighting (e.g. 'w1') a dict with the weighting factor of every raster
+    resolution: str or float
+        Pixel size of the result
+    threads: int
+        Number of threads (default None: one per processor core)
+    memory_budget: float
+        Memory budget in MB (default None: no budget)
+    temporary_dir: str
+        Directory of results kept on disk (default None: the temporary directory of the system)
+    read_ahead: int
+        Number of rasters read ahead in the background (default 2, see prefetch)
+
+    Returns
+    -------
+    suitability_values: dict
+        For every weighting the normalized suitability, NaN where any of the rasters has no data
+    transform: Affine
+        Transform of the result
+    crs: CRS
+        Coordinate reference system of the rasters
+    """
+
+    # matrix of the weighting factors, one row per weighting and one column per raster
+    weightings = list(weights)
+    weight_matrix = np.array([[weights[weighting][item] for item in items] for weighting in weightings], dtype=float)
+    for weighting in weightings:
+        for item in items:
+            print('Multiply ' + item + ' with weighting factor ' + weighting + ': ' + str(weights[weighting][item]))
+
+    # memory per pixel of a band: values read with their mask and validity, their vector and the
+    # vectors read ahead, digitized indices and classes, and the sums of all weightings with the weighted classes
+    max_pixels = chunk_pixels(memory_budget, 8 + 2 + 8 * (1 + read_ahead) + 16 + 1 + 16 * len(weightings),
+                              thread_count(threads))
+    # pixels where all rasters have data, calculated once
+    grid = valid_pixels(paths, bands, max_pixels, memory_budget)
+    crs = grid['crs']
+    transform, width, height = resampled_grid(grid['transform'], grid['width'], grid['height'], resolution)
+    rows, cols = nearest_indices(grid['transform'], grid['width'], grid['height'], transform, width, height)
+    suitability_values = accumulator((len(weightings), height, width), memory_budget, temporary_dir)
+
+    with raster_handles(paths, threads) as handles:
+        def sum_band(band_window):
+            """Suitability sums of one band of rows, returns their highest and lowest value per weighting"""
+
+            window, positions = band_window
+            if positions.start == positions.stop:
+                return None
+            sources = handles.get()
+            try:
+                # suitability sums of all weightings: weights matrix x classes of the valid pixels
+                suitability_sum = np.zeros((len(weightings), positions.stop - positions.start))
+                # the next rasters are read while the current one is classified and added
+                read_vector = lambda index: pixel_vector(sources[index], bands[index], grid, window)
+                for index, classes in prefetch(read_vector, range(len(paths)), read_ahead):
+                    if classifications[index] is not None:
+                        classes = classifications[index](classes)
+                    suitability_sum += weight_matrix[:, index, None] * classes
+            finally:
+                handles.put(sources)
+            # keep the sums at the pixels of the resampled grid that lie in this band, these
+            # are whole rows of the resampled grid, which are never shared by two bands
+            band_rows = np.flatnonzero((rows >= window.row_off) & (rows < window.row_off + window.height))
+            if len(band_rows) > 0:
+                # position of the pixels of these rows in the vectors of valid pixels
+                position, found = grid_positions(grid, rows[band_rows], cols, max_pixels)
+                values = suitability_values[:, band_rows[0]:band_rows[-1] + 1]
+                values[:, found] = suitability_sum[:, position[found] - positions.start]
+            return suitability_sum.max(axis=1), suitability_sum.min(axis=1)
+
+        # at least a few bands per thread, so the threads are kept busy
+        max_pixels = min(max_pixels, grid['width'] * grid['height'] // (4 * thread_count(threads)) + 1)
+        sources = handles.get()
+        band_windows = row_bands(sources[0], grid, max_pixels)
+        handles.put(sources)
+        # phase 1: the bands are summed up concurrently, each one returns its extremes
+        extremes = [extreme for extreme in map_tiles(sum_band, band_windows, threads) if extreme is not None]
+
+    # phase 2: the extremes of the bands are reduced to the extremes of the whole grid, which normalize the sums
+    highest = np.max([extreme[0] for extreme in extremes], axis=0) if extremes else np.full(len(weightings), np.nan)
+    lowest = np.min([extreme[1] for extreme in extremes], axis=0) if extremes else np.full(len(weightings), np.nan)
+
+    results = {}
+    for index, weighting in enumerate(weightings):
+        print('Highest value ' + weighting + ': ' + str(highest[index]))
+        print('Lowest value ' + weighting + ': ' + str(lowest[index]))
+        # normalize the raster values by dividing by the highest value, in place
+        suitability_values[index] /= highest[index]
+        results[weighting] = suitability_values[index]
+    return results, transform, crs
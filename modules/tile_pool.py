@@ -0,0 +1,164 @@
+"""
+tile_pool.py<br>
+python 3.6.7<br>
+Definition of functions to process the tiles of rasters concurrently on a thread pool and to read ahead in the background<br>
+@author: Lisa Stubert<br>
+@date: 2019-05-30<br>
+"""
+
+import os
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+import rasterio
+
+
+def thread_count(threads=None):
+    """Number of threads to use
+
+    Parameters
+    ----------
+    threads: int
+        Requested number of threads (default None: one per processor core)
+
+    Returns
+    -------
+    threads: int
+        At least 1
+    """
+
+    if threads is None:
+        threads = os.cpu_count() or 1
+    return max(1, int(threads))
+
+
+def map_tiles(function, tiles, threads=None):
+    """Call a function for every tile on a thread pool
+
+    Reading with GDAL and most NumPy operations release the GIL, so the tiles
+    are processed concurrently. With one thread (or one tile) no pool is started.
+
+    Parameters
+    ----------
+    function: function
+        Called with one tile, must only change data of its own tile
+    tiles: list
+        Tiles, e.g. windows
+    threads: int
+        Number of threads (default None: one per processor core)
+
+    Returns
+    -------
+    results: list
+        Return value of the function for every tile, in the order of the tiles
+    """
+
+    threads = min(thread_count(threads), len(tiles))
+    if threads <= 1:
+        return [function(tile) for tile in tiles]
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        return list(executor.map(function, tiles))
+
+
+@contextmanager
+def raster_handles(paths, threads=None):
+    """Queue of opened rasters, one set per thread
+
+    A rasterio dataset must not be used by two threads at the same time, so every
+    thread takes a set of opened rasters from the queue for one tile and puts it
+    back afterwards. All rasters are closed at the end.
+
+    Parameters
+    ----------
+    paths: list
+        Paths to the rasters
+    threads: int
+        Number of threads (default None: one per processor core)
+
+    Returns
+    -------
+    handles: Queue
+        Lists of the opened rasters, in the order of paths
+    """
+
+    handles = queue.Queue()
+    opened = []
+    try:
+        for i in range(thread_count(threads)):
+            sources = []
+            opened.append(sources)
+            for path in paths:
+                sources.append(rasterio.open(path))
+            handles.put(sources)
+        yield handles
+    finally:
+        for sources in opened:
+            for src in sources:
+                src.close()
+
+
+def prefetch(read, items, read_ahead=2):
+    """Read items in a background thread while the previous ones are processed
+
+    A reader thread calls read for every item in order and puts the results into
+    a queue that holds at most read_ahead results, so decoding the next window or
+    raster overlaps with the processing of the current one while the memory needed
+    stays predictable. Errors of read are raised when their item is reached. With
+    read_ahead 0 the items are read one after the other without a thread.
+
+    Parameters
+    ----------
+    read: function
+        Called with one item, e.g. reads a window; the rasters it uses must not
+        be used by the caller at the same time
+    items: list
+        Items to read, e.g. windows or indices of rasters
+    read_ahead: int
+        Maximum number of results waiting in the queue (default 2)
+
+    Returns
+    -------
+    results: generator
+        Tuples of item and result of read, in the order of items
+    """
+
+    items = list(items)
+    if read_ahead < 1 or len(items) <= 1:
+        for item in items:
+            yield item, read(item)
+        return
+
+    results = queue.Queue(maxsize=read_ahead)
+    stop = threading.Event()
+
+    def reader():
+        for item in items:
+            if stop.is_set():
+                return
+            try:
+                result = read(item)
+            except BaseException as error:
+                results.put((item, None, error))
+                return
+            # waits while the queue is full
+            results.put((item, result, None))
+
+    thread = threading.Thread(target=reader, daemon=True)
+    thread.start()
+    try:
+        for i in range(len(items)):
+            item, result, error = results.get()
+            if error is not None:
+                raise error
+            yield item, result
+    finally:
+        # stop the reader, also if it waits for a free place in the queue
+        stop.set()
+        while thread.is_alive():
+            try:
+                results.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        thread.join()
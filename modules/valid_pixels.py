@@ -0,0 +1,222 @@
+"""
+valid_pixels.py<br>
+python 3.6.7<br>
+Definition of functions to hold rasters as vectors of the pixels where all of them have data<br>
+@author: Lisa Stubert<br>
+@date: 2019-05-30<br>
+"""
+
+import os
+from collections import OrderedDict
+
+import numpy as np
+import rasterio
+from rasterio.windows import Window
+
+from modules.fingerprint import file_fingerprint
+from modules.memory_budget import cache_bytes
+from modules.raster_catalog import grid_differences
+from modules.raster_stack import read_window
+from modules.raster_windows import row_windows
+from modules.tile_pool import prefetch
+
+# validity of single rasters already read in this session, as packed bits, keyed by path and content,
+# the least recently used one first
+_known_validity = OrderedDict()
+
+
+def valid_pixels(paths, bands=None, max_pixels=4194304, memory_budget=None):
+    """Pixels where all rasters of a grid have data
+
+    The validity of every raster (not masked and finite) is calculated once per
+    raster file as packed bits (np.packbits, one bit per pixel, row by row). The
+    bits of the recently used rasters are kept in memory for later models, as
+    long as they fit into an eighth of the memory budget (see cache_bytes). The union of the nodata masks of all rasters is the bitwise and
+    of these bits, so no full-size array is ever needed. Every raster can then be
+    held as a dense vector of its values at the valid pixels in row-major order
+    (see pixel_vector), and only the results are put back into a grid (see
+    grid_positions).
+
+    Parameters
+    ----------
+    paths: list
+        Paths to the rasters, all on the same grid (see raster_catalog), otherwise
+        a ValueError is raised
+    bands: list
+        Memory map of every raster returned by stack_band, or None (default None:
+        all rasters are read from their files)
+    max_pixels: int
+        Maximum number of pixels read at once (default 4194304)
+    memory_budget: float
+        Memory budget in MB, limits the validity kept in memory (default None: no budget)
+
+    Returns
+    -------
+    grid: dict
+        'packed': validity as packed bits (rows x bytes), 'offsets': position of
+        the first valid pixel of every row in the vectors (one more entry than
+        rows, the last one is the number of valid pixels), 'width', 'height',
+        'transform' and 'crs' of the grid
+    """
+
+    if bands is None:
+        bands = [None] * len(paths)
+    grid = None
+    packed = None
+    for path, band in zip(paths, bands):
+        with rasterio.open(path) as src:
+            if grid is None:
+                grid = {'width': src.width, 'height': src.height, 'transform': src.transform, 'crs': src.crs}
+            # the vectors of all rasters must hold the same pixels
+            differences = grid_differences(src, grid)
+            if differences:
+                raise ValueError('Raster ' + path + ' is not on the grid of ' + paths[0] + ' (' + ', '.join(differences) + ')')
+            raster_packed = _raster_validity(src, path, band, max_pixels, memory_budget)
+        if packed is None:
+            packed = raster_packed.copy()
+        else:
+            packed &= raster_packed
+    return _with_offsets(grid, packed, max_pixels)
+
+
+def row_bands(src, grid, max_pixels=4194304):
+    """Bands of whole rows of a grid and the positions of their valid pixels in the vectors
+
+    Parameters
+    ----------
+    src: rasterio dataset
+        Opened raster of the grid, its blocks decide the height of the bands
+    grid: dict
+        Grid returned by valid_pixels
+    max_pixels: int
+        Maximum number of pixels of a band (default 4194304)
+
+    Returns
+    -------
+    bands: list
+        Tuples of the window of the band and the slice of the vectors with its valid pixels
+    """
+
+    offsets = grid['offsets']
+    return [(window, slice(int(offsets[window.row_off]), int(offsets[window.row_off + window.height])))
+            for window in row_windows(src, max_pixels)]
+
+
+def valid_rows(grid, row_start, row_stop):
+    """Validity of the pixels of some rows of a grid
+
+    Parameters
+    ----------
+    grid: dict
+        Grid returned by valid_pixels
+    row_start: int
+    row_stop: int
+
+    Returns
+    -------
+    valid: array
+        Boolean array (rows x columns)
+    """
+
+    return np.unpackbits(grid['packed'][row_start:row_stop], axis=1, count=grid['width']).astype(bool)
+
+
+def pixel_vector(src, band, grid, window=None):
+    """Values of a raster at the valid pixels of a grid
+
+    Parameters
+    ----------
+    src: rasterio dataset
+        Opened raster on the grid
+    band: array
+        Memory map of the raster returned by stack_band, or None
+    grid: dict
+        Grid returned by valid_pixels
+    window: Window
+        Band of whole rows returned by row_bands (default None: the whole raster)
+
+    Returns
+    -------
+    vector: array
+        Values of the valid pixels of the window, in row-major order
+    """
+
+    if window is None:
+        window = Window(0, 0, grid['width'], grid['height'])
+    values = np.ma.getdata(read_window(src, band, window))
+    return values[valid_rows(grid, window.row_off, window.row_off + window.height)]
+
+
+def grid_positions(grid, rows, cols, max_pixels=4194304):
+    """Positions in the vectors of the pixels of a grid at given rows and columns
+
+    The rows are unpacked a few at a time, so only max_pixels pixels are held at once.
+
+    Parameters
+    ----------
+    grid: dict
+        Grid returned by valid_pixels
+    rows: array
+        Rows of the grid, -1 outside of it (e.g. returned by nearest_indices)
+    cols: array
+        Columns of the grid, -1 outside of it
+    max_pixels: int
+        Maximum number of pixels unpacked at once (default 4194304)
+
+    Returns
+    -------
+    position: array
+        Position in the vectors for every row x column
+    found: array
+        True where the pixel is valid, only there position can be used
+    """
+
+    position = np.zeros((len(rows), len(cols)), dtype=np.int64)
+    found = np.zeros((len(rows), len(cols)), dtype=bool)
+    inside_cols = np.flatnonzero(cols >= 0)
+    inside_rows = np.flatnonzero(rows >= 0)
+    step = max(1, max_pixels // grid['width'])
+    for start in range(0, len(inside_rows), step):
+        chunk = inside_rows[start:start + step]
+        valid = np.unpackbits(grid['packed'][rows[chunk]], axis=1, count=grid['width']).astype(bool)
+        # number of valid pixels up to every pixel of the row
+        rank = np.cumsum(valid, axis=1, dtype=np.int64)
+        found[chunk[:, None], inside_cols] = valid[:, cols[inside_cols]]
+        position[chunk[:, None], inside_cols] = grid['offsets'][rows[chunk], None] + rank[:, cols[inside_cols]] - 1
+    return position, found
+
+
+def _with_offsets(grid, packed, max_pixels=4194304):
+    """Copy of a grid with new packed validity and the offsets of its rows"""
+
+    counts = np.zeros(grid['height'], dtype=np.int64)
+    step = max(1, max_pixels // grid['width'])
+    for start in range(0, grid['height'], step):
+        counts[start:start + step] = np.unpackbits(
+            packed[start:start + step], axis=1, count=grid['width']).sum(axis=1)
+    offsets = np.concatenate([[0], np.cumsum(counts)])
+    return dict(grid, packed=packed, offsets=offsets)
+
+
+def _raster_validity(src, path, band, max_pixels, memory_budget=None):
+    """Validity of every pixel of a raster as packed bits, read in bands of whole rows and kept in memory if it fits"""
+
+    key = (os.path.abspath(path), file_fingerprint(path))
+    if key in _known_validity:
+        _known_validity.move_to_end(key)
+        return _known_validity[key]
+
+    packed = np.zeros((src.height, (src.width + 7) // 8), dtype=np.uint8)
+    # the next band is read while the validity of the current one is packed
+    read = lambda window: read_window(src, band, window)
+    for window, values in prefetch(read, row_windows(src, max_pixels), 1):
+        valid = ~np.ma.getmaskarray(values) & np.isfinite(np.ma.getdata(values))
+        packed[window.row_off:window.row_off + window.height] = np.packbits(valid, axis=1)
+
+    # the validity of the least recently used rasters is dropped until the new one fits
+    limit = cache_bytes(memory_budget)
+    if packed.nbytes <= limit:
+        while _known_validity and sum(known.nbytes for known in _known_validity.values()) + packed.nbytes > limit:
+            _known_validity.popitem(last=False)
+        _known_validity[key] = packed
+    return packed
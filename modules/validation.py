@@ -7,14 +7,13 @@ Definition of a function to get raster values within buffers<br>
 """
 
 import numpy as np
-import rasterio
-from rasterio.mask import mask
 import geopandas as gpd
-from shapely.geometry import mapping
 from shapely.geometry import Point
 
+from modules.site_sampler import sample_sites
 
-def validation(working_dir, result_name, testdata, x_list, y_list, value_list):
+
+def validation(working_dir, result_name, testdata, x_list, y_list, value_list, mask_path=None, mask_cache_dir=None, samples=None):
     """Validation   
 
     Parameters
@@ -31,6 +30,14 @@ def validation(working_dir, result_name, testdata, x_list, y_list, value_list):
         Contains y_coordinates of sites where validation values were already calculated from other subsets
     value_list: list
         Contains validation values already calculated from other subsets
+    mask_path: str
+        Path to a shapefile with the polygons to keep, pixels outside of it are
+        not used (default None: no mask)
+    mask_cache_dir: str
+        Directory of the cache of rasterized masks (default None: no cache, the mask is rasterized every time)
+    samples: dataframe
+        Suitability at the sites of testdata returned by sample_sites for this
+        result, e.g. shared with gain (default None: the sites are sampled here)
 
     Returns
     -------
@@ -54,45 +61,14 @@ def validation(working_dir, result_name, testdata, x_list, y_list, value_list):
     shapefile = testdata
     # save crs, needed later
     crs = shapefile.crs
-    # make list of polygons as shapely geometries
-    g = shapefile.geometry.values
 
-    # for every raster loop over every buffer
-    for geometry in g:
-        # calculate very small buffer for every site, under which the suitability values will be averaged
-        geoms = Point(geometry.centroid.x, geometry.centroid.y).buffer(5)
-        # transform to GeJSON format
-        geoms = [mapping(geoms)]
-        # import raster and extract the raster values within the polygon
-        with rasterio.open(path_raster) as src:
-            out_image, out_transform = mask(src, geoms, crop=True, all_touched=True)
-        out_image = out_image.astype(float)
-        # extract the values of the masked array
-        data = out_image[0]
-       # print('****')
-        #print(out_image[0])
-        # no data values of the original raster
-        no_data = src.nodata
-        # extract the row, columns of the valid values
-        row, col = np.where(data != no_data)
-        # extract the valid values
-        value = np.extract(data != no_data, data)
-        #print(no_data,value)
-        # calculate average value
-        _sum = 0
-        count = 0
-        for i in range(0, len(value)):
-            _sum += value[i]
-            count += 1
-         #   print("Sum " + str(_sum))
-         #   print("Count " + str(count))
-        average = _sum / count
-       # print("Average " + str(average))
-        value_list.append(average)
-        x_list.append(geometry.centroid.x)
-        y_list.append(geometry.centroid.y)
-       # print(x_list)
-        #print(y_list)
+    # average of the pixels that touch a very small buffer (5 m) around every site
+    if samples is None:
+        samples = sample_sites(path_raster, shapefile.geometry.values, 5, mask_path, mask_cache_dir)
+    value_list.extend(samples['suitability_value'])
+    x_list.extend(samples['x'])
+    y_list.extend(samples['y'])
+
     x = x_list
     y = y_list
 
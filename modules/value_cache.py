@@ -0,0 +1,98 @@
+"""
+value_cache.py<br>
+python 3.6.7<br>
+Definition of functions to store extracted raster values of sites across runs<br>
+@author: Lisa Stubert<br>
+@date: 2019-05-30<br>
+"""
+
+import os
+import sqlite3
+import time
+
+
+def _connect(cache_dir):
+    """Open the cache database and create the table if needed"""
+
+    os.makedirs(cache_dir, exist_ok=True)
+    connection = sqlite3.connect(os.path.join(cache_dir, 'site_values.sqlite'))
+    connection.execute('CREATE TABLE IF NOT EXISTS site_values ('
+                       'raster TEXT, site TEXT, options TEXT, value REAL, used REAL, '
+                       'PRIMARY KEY (raster, site, options))')
+    connection.execute('CREATE INDEX IF NOT EXISTS site_values_used ON site_values (used)')
+    return connection
+
+
+def lookup_values(cache_dir, raster_key, site_keys, options_key):
+    """Get cached values of sites
+
+    Parameters
+    ----------
+    cache_dir: str
+        Directory of the cache
+    raster_key: str
+        Fingerprint of the raster
+    site_keys: list
+        Fingerprints of the site geometries
+    options_key: str
+        Description of the extraction options
+
+    Returns
+    -------
+    cached_values: dict
+        Cached value for every site key that was found. Values of sites without
+        valid pixels are NaN.
+    """
+
+    cached_values = {}
+    unique_keys = list(set(site_keys))
+    connection = _connect(cache_dir)
+    with connection:
+        # sqlite limits the number of parameters of a query
+        for start in range(0, len(unique_keys), 500):
+            chunk = unique_keys[start:start + 500]
+            query = ('SELECT site, value FROM site_values WHERE raster = ? AND options = ? AND site IN ({})'
+                     .format(','.join('?' * len(chunk))))
+            for site, value in connection.execute(query, [raster_key, options_key] + chunk):
+                cached_values[site] = float('nan') if value is None else value
+            # mark the found values as recently used
+            connection.execute('UPDATE site_values SET used = ? WHERE raster = ? AND options = ? AND site IN ({})'
+                               .format(','.join('?' * len(chunk))), [time.time(), raster_key, options_key] + chunk)
+    connection.close()
+    return cached_values
+
+
+def store_values(cache_dir, raster_key, site_keys, options_key, values, max_entries):
+    """Add values of sites to the cache
+
+    If the cache holds more than max_entries values afterwards, the least recently
+    used values are deleted.
+
+    Parameters
+    ----------
+    cache_dir: str
+        Directory of the cache
+    raster_key: str
+        Fingerprint of the raster
+    site_keys: list
+        Fingerprints of the site geometries
+    options_key: str
+        Description of the extraction options
+    values: list
+        Extracted values, in the order of site_keys
+    max_entries: int
+        Maximum number of values kept in the cache
+    """
+
+    now = time.time()
+    # NaN is stored as NULL
+    rows = [(raster_key, site, options_key, None if value != value else float(value), now)
+            for site, value in zip(site_keys, values)]
+    connection = _connect(cache_dir)
+    with connection:
+        connection.executemany('INSERT OR REPLACE INTO site_values VALUES (?, ?, ?, ?, ?)', rows)
+        count = connection.execute('SELECT COUNT(*) FROM site_values').fetchone()[0]
+        if count > max_entries:
+            connection.execute('DELETE FROM site_values WHERE rowid IN '
+                               '(SELECT rowid FROM site_values ORDER BY used LIMIT ?)', (count - max_entries,))
+    connection.close()
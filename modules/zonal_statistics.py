@@ -0,0 +1,505 @@
+"""
+zonal_statistics.py<br>
+python 3.6.7<br>
+Definition of functions to calculate (weighted) statistics of raster values within many polygons or circles at once<br>
+@author: Lisa Stubert<br>
+@date: 2019-05-30<br>
+"""
+
+import numpy as np
+import pandas as pd
+import rasterio
+from rasterio.features import rasterize
+from rasterio.windows import Window
+
+from modules.output_rasters import read_unscaled
+
+
+def zonal_statistics(raster_path, geometries, all_touched=True, mask=None):
+    """Calculate zonal statistics for many polygons in one pass
+
+    The raster is opened once. Nearby polygons are grouped into shared read windows
+    aligned to the block layout of the raster (see block_aligned_groups), so every
+    block is decoded once for all polygons that touch it. Inside a window the
+    polygons are burned into a label grid, in which every pixel holds the number of
+    the polygon it belongs to. Mean, count, min and max of the valid pixel values
+    are then calculated for all polygons together with bincount-style reductions.
+    Polygons that touch the same pixels are burned into separate label grids, so
+    every polygon gets exactly the pixels that rasterio.mask would return for it.
+
+    Parameters
+    ----------
+    raster_path: str
+        Path to the raster
+    geometries: array
+        Shapely polygons, e.g. the geometry column of a GeoDataFrame
+    all_touched: bool
+        Include every pixel that touches a polygon (default True)
+    mask: array
+        Boolean array of the grid of the raster, pixels where it is False are not
+        counted (default None: all pixels with data are counted)
+
+    Returns
+    -------
+    df_zonal_statistics: dataframe
+        One row per polygon (in the order of geometries) with the columns
+        'mean', 'count', 'min' and 'max'. Polygons without valid pixels get NaN.
+    """
+
+    geometries = list(geometries)
+    n = len(geometries)
+    value_sum = np.zeros(n)
+    value_count = np.zeros(n)
+    value_min = np.full(n, np.inf)
+    value_max = np.full(n, -np.inf)
+
+    if n > 0:
+        bounds = np.array([geometry.bounds for geometry in geometries])
+        with rasterio.open(raster_path) as src:
+            pixel_size = max(abs(src.transform.a), abs(src.transform.e))
+            for window, group in block_aligned_groups(src.transform, src.width, src.height,
+                                                      src.block_shapes[0], bounds):
+                # values with the scale and offset of the raster (e.g. quantized results)
+                data, nodata = read_unscaled(src, window)
+                transform = src.window_transform(window)
+                # pixels with no data are never counted
+                valid = _valid_pixels(data, nodata)
+                if mask is not None:
+                    valid &= mask[window.row_off:window.row_off + data.shape[0],
+                                  window.col_off:window.col_off + data.shape[1]]
+
+                # burn every layer of polygons that do not touch the same pixels into its own label grid
+                for layer in _non_overlapping_layers(bounds[group], pixel_size):
+                    labels = rasterize(((geometries[group[i]], i + 1) for i in layer), out_shape=data.shape,
+                                       transform=transform, fill=0, all_touched=all_touched, dtype='int32')
+                    selected = (labels > 0) & valid
+                    # label 0 is the background, it is dropped
+                    _accumulate(group, labels[selected] - 1, data[selected].astype(float),
+                                value_sum, value_count, value_min, value_max)
+
+    empty = value_count == 0
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = value_sum / value_count
+    value_min[empty] = np.nan
+    value_max[empty] = np.nan
+
+    df_zonal_statistics = pd.DataFrame({'mean': mean, 'count': value_count.astype(int),
+                                        'min': value_min, 'max': value_max})
+    return df_zonal_statistics
+
+
+def zonal_statistics_radii(raster_path, points, radii, all_touched=True):
+    """Calculate zonal statistics for circles of several radii around points in one pass
+
+    The raster is opened once and nearby points share block-aligned read windows,
+    like in zonal_statistics. For every point the pixels around it are sorted into
+    distance bands between the requested radii. Sum, count, min and max are
+    calculated per band for all points together and accumulated from the inner to
+    the outer band, so every additional radius costs only the pixels of its band.
+    No buffer polygons are needed. Pixels are selected by their exact distance to
+    the center, so single pixels at the border can differ from those of buffer
+    polygons made in a GIS.
+
+    Parameters
+    ----------
+    raster_path: str
+        Path to the raster
+    points: array
+        Shapely geometries of the sites, their centroids are used as center
+    radii: list
+        Radii of the circles in map units
+    all_touched: bool
+        Include every pixel that touches a circle (default True). If False, only
+        pixels with their center inside the circle are included.
+
+    Returns
+    -------
+    zonal_statistics_per_radius: dict
+        For every radius a dataframe with one row per point (in the order of points)
+        and the columns 'mean', 'count', 'min' and 'max'
+    """
+
+    radii = [float(radius) for radius in radii]
+    bands = np.unique(radii)
+    n = len(points)
+    n_bands = len(bands)
+    value_sum = np.zeros(n * n_bands)
+    value_count = np.zeros(n * n_bands)
+    value_min = np.full(n * n_bands, np.inf)
+    value_max = np.full(n * n_bands, -np.inf)
+
+    if n > 0:
+        x = np.array([point.centroid.x for point in points])
+        y = np.array([point.centroid.y for point in points])
+        max_radius = bands[-1]
+        bounds = np.column_stack([x - max_radius, y - max_radius, x + max_radius, y + max_radius])
+        with rasterio.open(raster_path) as src:
+            for window, group in block_aligned_groups(src.transform, src.width, src.height,
+                                                      src.block_shapes[0], bounds):
+                # values with the scale and offset of the raster (e.g. quantized results)
+                data, nodata = read_unscaled(src, window)
+                transform = src.window_transform(window)
+                for point_index, band, value in _distance_bands(data, transform, nodata, x[group], y[group],
+                                                                bands, all_touched):
+                    # every point has one label per distance band
+                    labels, local_label = np.unique(group[point_index] * n_bands + band, return_inverse=True)
+                    _accumulate(labels, local_label, value, value_sum, value_count, value_min, value_max)
+
+    # accumulate the bands from the inner to the outer circle
+    value_sum = np.cumsum(value_sum.reshape(n, n_bands), axis=1)
+    value_count = np.cumsum(value_count.reshape(n, n_bands), axis=1)
+    value_min = np.minimum.accumulate(value_min.reshape(n, n_bands), axis=1)
+    value_max = np.maximum.accumulate(value_max.reshape(n, n_bands), axis=1)
+    empty = value_count == 0
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = value_sum / value_count
+    value_min[empty] = np.nan
+    value_max[empty] = np.nan
+
+    zonal_statistics_per_radius = {}
+    for radius in radii:
+        i = int(np.searchsorted(bands, radius))
+        zonal_statistics_per_radius[radius] = pd.DataFrame({
+            'mean': mean[:, i], 'count': value_count[:, i].astype(int),
+            'min': value_min[:, i], 'max': value_max[:, i]})
+    return zonal_statistics_per_radius
+
+
+def weighted_zonal_statistics(raster_path, geometries, percentiles=(25, 50, 75), supersampling=8):
+    """Calculate coverage-weighted zonal statistics for many polygons in one pass
+
+    Every pixel touched by a polygon is weighted with the fraction of its area
+    covered by the polygon, so pixels at the edge of small buffers count less than
+    pixels inside. The coverage is measured by burning the polygons into a grid that
+    is finer by the supersampling factor and counting the covered sub-pixels. The
+    raster is read in the same block-aligned windows as in zonal_statistics. The
+    weighted mean and the weighted percentiles of all polygons are then calculated
+    together with array operations on the collected pixels.
+
+    Parameters
+    ----------
+    raster_path: str
+        Path to the raster
+    geometries: array
+        Shapely polygons, e.g. the geometry column of a GeoDataFrame
+    percentiles: tuple
+        Percentiles to calculate (default 25, 50 and 75)
+    supersampling: int
+        Number of sub-pixels per pixel side used to measure the coverage (default 8)
+
+    Returns
+    -------
+    df_weighted_zonal_statistics: dataframe
+        One row per polygon (in the order of geometries) with the columns
+        'weighted_mean', 'weighted_median', 'weighted_p<percentile>' for every
+        percentile and 'coverage', the covered area in pixels. The weighted
+        percentiles are the smallest values whose cumulative weight reaches the
+        percentile. Polygons without valid pixels get NaN.
+    """
+
+    geometries = list(geometries)
+    n = len(geometries)
+    site_list = []
+    value_list = []
+    weight_list = []
+
+    if n > 0:
+        bounds = np.array([geometry.bounds for geometry in geometries])
+        with rasterio.open(raster_path) as src:
+            pixel_size = max(abs(src.transform.a), abs(src.transform.e))
+            for window, group in block_aligned_groups(src.transform, src.width, src.height,
+                                                      src.block_shapes[0], bounds):
+                # values with the scale and offset of the raster (e.g. quantized results)
+                data, nodata = read_unscaled(src, window)
+                transform = src.window_transform(window)
+                height, width = data.shape
+                fine_transform = transform * transform.scale(1.0 / supersampling)
+                valid = _valid_pixels(data, nodata)
+
+                for layer in _non_overlapping_layers(bounds[group], pixel_size):
+                    labels = rasterize(((geometries[group[i]], i + 1) for i in layer), out_shape=data.shape,
+                                       transform=transform, fill=0, all_touched=True, dtype='int32')
+                    # polygons of one layer never share a pixel, so the covered sub-pixels
+                    # of a pixel all belong to the polygon of its label
+                    covered = rasterize(((geometries[group[i]], 1) for i in layer),
+                                        out_shape=(height * supersampling, width * supersampling),
+                                        transform=fine_transform, fill=0, all_touched=False, dtype='uint8')
+                    coverage = covered.reshape(height, supersampling, width, supersampling).sum(axis=(1, 3))
+                    selected = (labels > 0) & valid & (coverage > 0)
+                    site_list.append(group[labels[selected] - 1])
+                    value_list.append(data[selected].astype(float))
+                    weight_list.append(coverage[selected] / float(supersampling ** 2))
+
+    if site_list:
+        site = np.concatenate(site_list)
+        value = np.concatenate(value_list)
+        weight = np.concatenate(weight_list)
+    else:
+        site = np.zeros(0, dtype=int)
+        value = np.zeros(0)
+        weight = np.zeros(0)
+
+    coverage = np.bincount(site, weights=weight, minlength=n)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        weighted_mean = np.bincount(site, weights=weight * value, minlength=n) / coverage
+    df_weighted_zonal_statistics = pd.DataFrame({'weighted_mean': weighted_mean})
+    df_weighted_zonal_statistics['weighted_median'] = _weighted_percentile(site, value, weight, n, 50)
+    for percentile in percentiles:
+        df_weighted_zonal_statistics['weighted_p{:g}'.format(percentile)] = _weighted_percentile(
+            site, value, weight, n, percentile)
+    df_weighted_zonal_statistics['coverage'] = coverage
+    return df_weighted_zonal_statistics
+
+
+def block_aligned_groups(transform, width, height, block_shape, bounds):
+    """Group nearby sites into shared read windows aligned to the block layout
+
+    The sites are put into a grid index whose cells are made of whole blocks of
+    the raster and are at least as large as the largest site. All sites that start
+    in the same cell share one read window, which is the union of their pixel
+    windows extended to block boundaries. Every block is therefore decoded once
+    for all sites of a cell instead of once per site.
+
+    Parameters
+    ----------
+    transform: Affine
+        Geotransform of the raster
+    width: int
+        Number of columns of the raster
+    height: int
+        Number of rows of the raster
+    block_shape: tuple
+        Rows and columns of a block of the raster
+    bounds: array
+        Bounding boxes (minx, miny, maxx, maxy) of the sites
+
+    Returns
+    -------
+    groups: list
+        Tuples of the read window and the indices of the sites read with it.
+        Sites outside the raster are not in any group.
+    """
+
+    block_height, block_width = block_shape
+    # pixel windows of all sites, snapped outwards to the pixel grid and limited to the raster
+    cols, rows = ~transform * (bounds[:, [0, 2, 0, 2]], bounds[:, [1, 1, 3, 3]])
+    col_start = np.clip(np.floor(cols.min(axis=1)), 0, width).astype(int)
+    col_stop = np.clip(np.ceil(cols.max(axis=1)), 0, width).astype(int)
+    row_start = np.clip(np.floor(rows.min(axis=1)), 0, height).astype(int)
+    row_stop = np.clip(np.ceil(rows.max(axis=1)), 0, height).astype(int)
+    inside = np.flatnonzero((col_stop > col_start) & (row_stop > row_start))
+    if len(inside) == 0:
+        return []
+
+    # size of the grid cells in blocks
+    cell_width = block_width * max(1, int(np.ceil((col_stop - col_start)[inside].max() / block_width)))
+    cell_height = block_height * max(1, int(np.ceil((row_stop - row_start)[inside].max() / block_height)))
+    n_cell_cols = width // cell_width + 1
+    cell = (row_start[inside] // cell_height) * n_cell_cols + col_start[inside] // cell_width
+    order = np.argsort(cell, kind='stable')
+    cell_ids, first = np.unique(cell[order], return_index=True)
+
+    groups = []
+    for group in np.split(inside[order], first[1:]):
+        # union of the site windows, extended to block boundaries
+        group_col_start = (col_start[group].min() // block_width) * block_width
+        group_row_start = (row_start[group].min() // block_height) * block_height
+        group_col_stop = min(-(-col_stop[group].max() // block_width) * block_width, width)
+        group_row_stop = min(-(-row_stop[group].max() // block_height) * block_height, height)
+        window = Window(int(group_col_start), int(group_row_start),
+                        int(group_col_stop - group_col_start), int(group_row_stop - group_row_start))
+        groups.append((window, group))
+    return groups
+
+
+def _valid_pixels(data, nodata):
+    """True for the values that are not the nodata value, which can also be NaN"""
+
+    if nodata is None:
+        return np.ones(data.shape, dtype=bool)
+    if np.isnan(nodata):
+        return ~np.isnan(data)
+    return data != nodata
+
+
+def _accumulate(index, label, value, value_sum, value_count, value_min, value_max):
+    """Add pixel values to the statistics of the sites
+
+    Parameters
+    ----------
+    index: array
+        Position of the local labels in the statistic arrays, without duplicates
+    label: array
+        Local label of every pixel
+    value: array
+        Value of every pixel
+    value_sum, value_count, value_min, value_max: array
+        Statistics of all sites, updated in place
+    """
+
+    n = len(index)
+    value_sum[index] += np.bincount(label, weights=value, minlength=n)
+    value_count[index] += np.bincount(label, minlength=n)
+    local_min = np.full(n, np.inf)
+    local_max = np.full(n, -np.inf)
+    np.minimum.at(local_min, label, value)
+    np.maximum.at(local_max, label, value)
+    value_min[index] = np.minimum(value_min[index], local_min)
+    value_max[index] = np.maximum(value_max[index], local_max)
+
+
+def _weighted_percentile(site, value, weight, n, percentile):
+    """Weighted percentile of the pixel values of every site
+
+    The pixels are sorted by site and value, so one cumulative sum of the weights
+    serves all sites. For every site the first pixel whose cumulative weight within
+    the site reaches the percentile is looked up with a single searchsorted call.
+
+    Parameters
+    ----------
+    site: array
+        Number of the site of every pixel
+    value: array
+        Value of every pixel
+    weight: array
+        Weight of every pixel
+    n: int
+        Number of sites
+    percentile: float
+        Percentile between 0 and 100
+
+    Returns
+    -------
+    result: array
+        Weighted percentile of every site, NaN for sites without pixels
+    """
+
+    result = np.full(n, np.nan)
+    if len(site) == 0:
+        return result
+    order = np.lexsort((value, site))
+    site = site[order]
+    value = value[order]
+    cumulative_weight = np.cumsum(weight[order])
+    # position of the first and last pixel of every site
+    present, first = np.unique(site, return_index=True)
+    last = np.append(first[1:], len(site)) - 1
+    weight_before = np.where(first > 0, cumulative_weight[first - 1], 0.0)
+    total_weight = cumulative_weight[last] - weight_before
+    target = weight_before + total_weight * percentile / 100.0
+    position = np.minimum(np.searchsorted(cumulative_weight, target, side='left'), last)
+    result[present] = value[position]
+    return result
+
+
+def _distance_bands(data, transform, nodata, x, y, bands, all_touched):
+    """Sort the valid pixels around points into distance bands
+
+    Parameters
+    ----------
+    data: array
+        Raster values of the read window
+    transform: Affine
+        Geotransform of the read window
+    nodata: float
+        No data value of the raster
+    x, y: array
+        Coordinates of the points
+    bands: array
+        Sorted outer radii of the distance bands
+    all_touched: bool
+        Measure the distance to the nearest edge of a pixel instead of its center
+
+    Yields
+    ------
+    point_index: array
+        Number of the point, for every valid pixel within the largest radius
+    band: array
+        Number of the distance band, for every pixel
+    value: array
+        Value of every pixel
+    """
+
+    height, width = data.shape
+    max_radius = bands[-1]
+    pixel_width = abs(transform.a)
+    pixel_height = abs(transform.e)
+    # position of the points in pixel coordinates of the window
+    col_position, row_position = ~transform * (x, y)
+    center_col = np.floor(col_position).astype(int)
+    center_row = np.floor(row_position).astype(int)
+    # offsets of all pixels that can be reached from the center pixel
+    reach_cols = int(np.ceil(max_radius / pixel_width)) + 1
+    reach_rows = int(np.ceil(max_radius / pixel_height)) + 1
+    offset_row, offset_col = np.mgrid[-reach_rows:reach_rows + 1, -reach_cols:reach_cols + 1]
+    offset_row = offset_row.ravel()
+    offset_col = offset_col.ravel()
+
+    # process the points in chunks to limit the size of the temporary arrays
+    chunk_size = max(1, 4000000 // len(offset_row))
+    for start in range(0, len(x), chunk_size):
+        stop = min(start + chunk_size, len(x))
+        rows = center_row[start:stop, None] + offset_row[None, :]
+        cols = center_col[start:stop, None] + offset_col[None, :]
+        inside = (rows >= 0) & (rows < height) & (cols >= 0) & (cols < width)
+        # distance between the point and the pixel (its nearest edge or its center)
+        if all_touched:
+            dx = np.maximum(np.maximum(cols - col_position[start:stop, None],
+                                       col_position[start:stop, None] - (cols + 1)), 0) * pixel_width
+            dy = np.maximum(np.maximum(rows - row_position[start:stop, None],
+                                       row_position[start:stop, None] - (rows + 1)), 0) * pixel_height
+        else:
+            dx = (cols + 0.5 - col_position[start:stop, None]) * pixel_width
+            dy = (rows + 0.5 - row_position[start:stop, None]) * pixel_height
+        distance = np.hypot(dx, dy)
+        selected = inside & (distance <= max_radius)
+        value = data[rows[selected], cols[selected]]
+        is_valid = _valid_pixels(value, nodata)
+        point_index = np.broadcast_to(np.arange(start, stop)[:, None], rows.shape)[selected]
+        band = np.searchsorted(bands, distance[selected], side='left')
+        yield point_index[is_valid], band[is_valid], value[is_valid].astype(float)
+
+
+def _non_overlapping_layers(bounds, pixel_size):
+    """Split polygons into groups that do not touch the same pixels
+
+    The bounding boxes are enlarged by one pixel, so polygons whose enlarged boxes
+    do not overlap cannot touch the same pixel. Every box is registered in the cells
+    of a grid with a cell size of the largest box, so it covers at most 2 x 2 cells.
+    Two overlapping boxes always share a cell, therefore a polygon is put into the
+    first group that has none of its cells occupied yet.
+
+    Parameters
+    ----------
+    bounds: array
+        Bounding boxes (minx, miny, maxx, maxy) of the polygons
+    pixel_size: float
+        Size of a pixel in map units
+
+    Returns
+    -------
+    layers: list
+        Lists of polygon indices
+    """
+
+    bounds = bounds + np.array([-pixel_size, -pixel_size, pixel_size, pixel_size])
+    cell_size = max((bounds[:, 2] - bounds[:, 0]).max(), (bounds[:, 3] - bounds[:, 1]).max())
+    first_col = np.floor(bounds[:, 0] / cell_size).astype(int)
+    last_col = np.floor(bounds[:, 2] / cell_size).astype(int)
+    first_row = np.floor(bounds[:, 1] / cell_size).astype(int)
+    last_row = np.floor(bounds[:, 3] / cell_size).astype(int)
+
+    layers = []
+    occupied = []
+    for i in range(len(bounds)):
+        cells = [(col, row) for col in range(first_col[i], last_col[i] + 1)
+                 for row in range(first_row[i], last_row[i] + 1)]
+        for layer, cells_in_use in zip(layers, occupied):
+            if not any(cell in cells_in_use for cell in cells):
+                layer.append(i)
+                cells_in_use.update(cells)
+                break
+        else:
+            layers.append([i])
+            occupied.append(set(cells))
+    return layers
@@ -8,7 +8,7 @@ Description:<br>
 """
 
 from set_data_paths import data_input
-from modules.process import modelling_process
+from modules.process import modelling_process_grid
 
 ################## Set the combinations and parameters for the model here #####
 
@@ -29,21 +29,44 @@ corr_thresholds = [1]
 
 # set cross-validation on or off, if validation is deactivated, the calculation duration is shortened
 test = False  # True or False
+
+# set further options
+options = {
+    'value_cache': True, # keep the extracted raster values of the sites in tmp/value_cache/ and reuse them in later runs
+    'value_cache_size': 1000000, # maximum number of cached values, the least recently used ones are deleted first
+    'site_points': None, # path to a shapefile of the site points (inside the data folder), if set the buffers of all buffer sizes are calculated around the points and no <size>_m_sites.shp is needed; the buffer sizes are diameters, e.g. buffer size '50' averages circles with a radius of 25 m
+    'site_buffer_sizes': None, # if site_points is set, buffer sizes whose values are calculated together with the current one, so later buffer sizes take them from the value cache; run_modelling.py sets it to buffer_sizes
+    'zonal_statistic': 'mean', # statistic of the raster values within a buffer: 'mean' of all touched pixels, or weighted by the covered part of each pixel: 'weighted_mean', 'weighted_median', 'weighted_p<percentile>' (e.g. 'weighted_p25')
+    'write_intermediates': False, # save the sites with raster values and reclassified values as shapefiles in tmp/sites_with_rastervalues/ for debugging
+    'reference_raster': None, # name of the predictor variable raster whose grid (crs, resolution, extent) is used, rasters on other grids are aligned to it once and kept in tmp/aligned/; None for the first raster
+    'raster_stack': False, # decode all predictor variable rasters once into a memory-mapped stack in tmp/stack/, all stages read from it (the rasters must be on the same grid); the stack needs as much disk space as the decoded rasters and holds float32 values, so float64 rasters are rounded to float32
+    'mask_path': 'example_data_set/mask_for_no_data_values/oceanmask.shp', # path to a shapefile of the land mass (inside the data folder), the results are cut with it; None for no mask
+    'class_rasters': False, # save reclassified rasters before the prediction; if False the rasters are reclassified, weighted and added up in one pass without class rasters
+    'reclass_cache': True, # if class_rasters is True, keep the reclassified rasters in tmp/reclass_cache/ and reuse them for models with the same class thresholds
+    'reclass_cache_size': 200, # maximum number of cached reclassified rasters, the least recently used ones are deleted first
+    'threads': None, # number of threads that read, reclassify and add up the tiles of the rasters at the same time; None for one per processor core
+    'memory_budget': None, # memory budget in MB, the rasters are processed in chunks that fit into it, larger results are kept on disk and the peak Python heap and peak resident memory of every model are reported; None for no budget
+    'read_ahead': 2, # number of rasters or windows read ahead in a background thread while the current one is processed, overlapping reading and calculation; 0 to read one after the other
+    'output_compress': 'deflate', # compression of the saved suitability and class rasters (all tiled): 'deflate', 'zstd' (needs GDAL with ZSTD), 'lzw' or None
+    'output_cog': False, # save the suitability rasters as Cloud Optimized GeoTIFF with internal overviews
+    'output_quantize': False, # save the suitability rasters as uint16 with scale and offset (half the size of float32 before compression, error below 1/100000 of the value range); gain and validation apply the scale and offset
+    'gain_thresholds': 1000, # number of thresholds between 0 and 1 of the gain curve saved in results/gain<model>.xlsx (sheet 'curve'), a multiple of 20 keeps the thresholds 0.1, ..., 0.75, ... exact
+}
  
 
 ##################Start modelling ###########################################
 
 # loading the paths to the data
 all_raster_data, buffer_dir, working_dir = data_input()
+# if site points are used, the values of all buffer sizes are calculated together
+if options['site_points'] is not None:
+    options['site_buffer_sizes'] = buffer_sizes
 
-# loop over predictore variable combinations, buffers and weightings
+# loop over predictore variable combinations and buffers
+# all weightings and thresholds are calculated together, models with the same selected variables are calculated only once
 for combination, variables in combinations.items():
         for buffer_size in buffer_sizes:
-                for weighting in weightings:
-                        for statistic_threshold in statistic_thresholds:
-                            for corr_threshold in corr_thresholds:
-                                for statistic_threshold_type in statistic_threshold_types:
-                                    # give all parameters to the modelling function
-                                    modelling_process(buffer_size, weighting,statistic_threshold,corr_threshold,statistic_threshold_type, all_raster_data, variables, combination, test, working_dir, buffer_dir)
+                # give all parameters to the modelling function
+                modelling_process_grid(buffer_size, weightings, statistic_thresholds, corr_thresholds, statistic_threshold_types, all_raster_data, variables, combination, test, working_dir, buffer_dir, options)
 
 print("No combinations left. Calculation finished")
\ No newline at end of file
@@ -27,7 +27,7 @@ def data_input():
     buffer_dir = 'example_data_set/buffered_sites/'
 
     # generate dictionary with predictor variables and their directory paths (inside the data folder)
-    #Note : keys must me limited to max. 10 characters
+    #Note : keys must me limited to max. 10 characters if the option write_intermediates is used, because column names of shapefiles are truncated
     all_raster_data = {
         # topography:
         # Note: Topography variables must be named with t_ in the beginning, because the algorithm only recognize them as topography variables by there name. This is import when variables are selected automatically by thresholds.
@@ -0,0 +1,52 @@
+"""
+conftest.py<br>
+python 3.6.7<br>
+Shared fixtures of the regression tests: synthetic rasters written to a temporary directory<br>
+@author: Lisa Stubert<br>
+@date: 2019-05-30<br>
+"""
+
+import os
+import sys
+
+import numpy as np
+import pytest
+import rasterio
+from rasterio.transform import from_origin
+
+# the modules are imported from the repository, also if pytest is not started there
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# nodata value of the synthetic rasters
+NODATA = -9999.0
+# upper left corner and pixel size of the synthetic rasters
+ORIGIN_X = 400000.0
+ORIGIN_Y = 4600000.0
+PIXEL_SIZE = 10.0
+
+
+@pytest.fixture
+def write_raster(tmp_path):
+    """Function that saves an array as tiled float32 GeoTIFF in a temporary directory and returns its path"""
+
+    def write(name, values, block_size=16):
+        path = str(tmp_path / name)
+        height, width = values.shape
+        with rasterio.open(path, 'w', driver='GTiff', width=width, height=height, count=1, dtype='float32',
+                           crs='EPSG:25831', transform=from_origin(ORIGIN_X, ORIGIN_Y, PIXEL_SIZE, PIXEL_SIZE),
+                           nodata=NODATA, tiled=True, blockxsize=block_size, blockysize=block_size) as dst:
+            dst.write(values.astype(np.float32), 1)
+        return path
+
+    return write
+
+
+def random_values(seed, height=60, width=70, missing=0.05):
+    """Synthetic raster values with a trend, a few integer steps (so values hit the thresholds exactly) and nodata"""
+
+    rng = np.random.default_rng(seed)
+    values = np.round(rng.random((height, width)) * 20 + np.linspace(0, 10, width), 0)
+    values[rng.random((height, width)) < missing] = NODATA
+    # a block without data in the upper left corner
+    values[:5, :7] = NODATA
+    return values
@@ -0,0 +1,51 @@
+"""
+test_gain_curve.py<br>
+python 3.6.7<br>
+Regression tests of the gain curve against sklearn and a direct count of the pixels and sites above the thresholds<br>
+@author: Lisa Stubert<br>
+@date: 2019-05-30<br>
+"""
+
+import numpy as np
+from sklearn.metrics import roc_auc_score
+
+from conftest import NODATA
+from modules.gain_curve import gain_at, gain_curve
+
+
+def suitability_values(seed, height=80, width=90):
+    """Suitability between 0 and 1 on a coarse step, so sites and pixels have ties, with nodata"""
+
+    rng = np.random.default_rng(seed)
+    values = np.round(rng.random((height, width)), 2)
+    values[rng.random((height, width)) < 0.05] = NODATA
+    return values
+
+
+def test_roc_auc_matches_sklearn(write_raster):
+    for seed in range(4):
+        values = suitability_values(seed)
+        path = write_raster('suitability' + str(seed) + '.tif', values)
+        pixels = values[values != NODATA].astype(np.float32).astype(float)
+        rng = np.random.default_rng(seed)
+        # sites prefer high values, one of them has no value
+        site_values = np.concatenate([np.sort(rng.choice(pixels, 300))[-60:], rng.choice(pixels, 20), [np.nan]])
+        curve, metrics = gain_curve(path, site_values, memory_budget=1)
+        sites = site_values[~np.isnan(site_values)]
+        expected = roc_auc_score(np.r_[np.ones(len(sites)), np.zeros(len(pixels))], np.r_[sites, pixels])
+        assert abs(metrics['roc_auc'] - expected) < 1e-12
+
+
+def test_gain_curve_matches_direct_count(write_raster):
+    values = suitability_values(5)
+    path = write_raster('suitability.tif', values)
+    pixels = values[values != NODATA].astype(np.float32).astype(float)
+    site_values = np.random.default_rng(5).choice(pixels, 50)
+    curve, metrics = gain_curve(path, site_values, bins=20)
+    rows = gain_at(curve, [0.1, 0.5, 0.75])
+    for index, threshold in enumerate([0.1, 0.5, 0.75]):
+        percent_area = (pixels > threshold).mean() * 100
+        percent_sites = (site_values > threshold).mean() * 100
+        assert abs(rows['percent area'][index] - percent_area) < 1e-9
+        assert abs(rows['percent sites'][index] - percent_sites) < 1e-9
+        assert abs(rows['gain'][index] - round(1 - percent_area / percent_sites, 5)) < 1e-9
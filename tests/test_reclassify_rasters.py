@@ -0,0 +1,66 @@
+"""
+test_reclassify_rasters.py<br>
+python 3.6.7<br>
+Regression tests of the reclassification against the np.where rules of the first version of reclassify_rasters<br>
+@author: Lisa Stubert<br>
+@date: 2019-05-30<br>
+"""
+
+import numpy as np
+import pandas as pd
+
+from modules.reclassify_rasters import CLASS_NODATA, class_thresholds, reclassify_block
+
+
+def reference_classes(item, raster_array, statistics):
+    """Classes of the np.where rules of the first version of reclassify_rasters, later rules overwrite earlier ones"""
+
+    raster_array_reclass = raster_array.copy()
+    if 'e_' in item or 'c_' in item:
+        raster_array_reclass[np.where(raster_array > statistics['upper_quartile75'])] = 0
+        raster_array_reclass[np.where(raster_array <= statistics['median'])] = 2
+        raster_array_reclass[np.where((statistics['median'] < raster_array) & (raster_array <= statistics['upper_quartile75']))] = 1
+    else:
+        raster_array_reclass[np.where(raster_array > statistics['upper_percentile87.5'])] = 0
+        raster_array_reclass[np.where(raster_array < statistics['lower_percentile12.5'])] = 0
+        raster_array_reclass[np.where((statistics['lower_quartile25'] <= raster_array)
+                                      & (raster_array <= statistics['upper_quartile75']))] = 2
+        raster_array_reclass[np.where((statistics['lower_quartile25'] > raster_array)
+                                      & (raster_array >= statistics['lower_percentile12.5']))] = 1
+        raster_array_reclass[np.where((statistics['upper_quartile75'] < raster_array)
+                                      & (raster_array <= statistics['upper_percentile87.5']))] = 1
+    return raster_array_reclass
+
+
+def random_statistics(rng):
+    """Boxplot statistics of a few integer site values, so thresholds often coincide and pixels hit them exactly"""
+
+    site_values = rng.integers(0, rng.integers(2, 12), size=rng.integers(3, 40))
+    lower_percentile12_5, lower_quartile25, median, upper_quartile75, upper_percentile87_5 = np.percentile(
+        site_values, [12.5, 25, 50, 75, 87.5])
+    return pd.Series({'lower_percentile12.5': lower_percentile12_5, 'lower_quartile25': lower_quartile25,
+                      'median': median, 'upper_quartile75': upper_quartile75,
+                      'upper_percentile87.5': upper_percentile87_5})
+
+
+def test_reclassify_block_matches_old_rules():
+    rng = np.random.default_rng(0)
+    for case in range(200):
+        statistics = random_statistics(rng)
+        # values on and between the thresholds, some of them without data
+        data = rng.integers(-2, 26, size=(30, 40)) / 2.0
+        missing = rng.random(data.shape) < 0.1
+        values = np.ma.masked_array(data, missing)
+        for item in ['t_slope', 'c_coast', 'e_river']:
+            thresholds, lookup = class_thresholds(item, statistics)
+            classes = reclassify_block(values, thresholds, lookup)
+            expected = reference_classes(item, data, statistics)
+            np.testing.assert_array_equal(classes[~missing], expected[~missing])
+            assert (classes[missing] == CLASS_NODATA).all()
+
+
+def test_reclassify_block_without_finite_values():
+    statistics = random_statistics(np.random.default_rng(1))
+    thresholds, lookup = class_thresholds('t_slope', statistics)
+    classes = reclassify_block(np.ma.masked_array([np.nan, np.inf, 1.0], [False, False, True]), thresholds, lookup)
+    assert (classes == CLASS_NODATA).all()
@@ -0,0 +1,98 @@
+"""
+test_selection.py<br>
+python 3.6.7<br>
+Regression tests of the predictor selection against the selection loop of the first version of boxplots<br>
+@author: Lisa Stubert<br>
+@date: 2019-05-30<br>
+"""
+
+import numpy as np
+import pandas as pd
+
+from modules.selection import select_predictors, select_predictors_grid
+
+
+def reference_selection(df_boxplot_statistics, correlation_matrix, statistic_threshold, corr_threshold, statistic_threshold_type):
+    """Selection loop of the first version of boxplots (with iloc instead of the removed ix)"""
+
+    corr_matrix = correlation_matrix.abs()
+    corr_matrix_ext = corr_matrix.where(np.triu(np.ones(corr_matrix.shape), k=1).astype(bool))
+
+    cost_distance_list = []
+    ranking_direction = statistic_threshold_type != 'w2'
+    rank_statistic = df_boxplot_statistics.sort_values(statistic_threshold_type, axis=1, ascending=ranking_direction)
+    for item in rank_statistic.columns:
+        if item.startswith('c_') and item != 'c_slop+asp':
+            cost_distance_list.append(item)
+            rank_statistic = rank_statistic.drop(columns=[item])
+
+    selection_list = []
+    while len(selection_list) < statistic_threshold:
+        if len(rank_statistic.columns) == 0:
+            break
+        for item in rank_statistic.columns:
+            if len(selection_list) < statistic_threshold:
+                selection_list.append(item)
+                rank_statistic = rank_statistic.drop(columns=[item])
+            else:
+                break
+
+        idx = corr_matrix_ext.index
+        cols = corr_matrix_ext.columns
+        for row in range(len(idx)):
+            for col in range(len(cols)):
+                if idx[row] in selection_list and cols[col] in selection_list:
+                    value = corr_matrix_ext.iloc[row, col]
+                    if np.isnan(value) or value <= corr_threshold:
+                        continue
+                    # iqr_norm: the variable with the higher value is removed, w2: the one with the lower value
+                    row_statistic = df_boxplot_statistics[idx[row]][statistic_threshold_type]
+                    col_statistic = df_boxplot_statistics[cols[col]][statistic_threshold_type]
+                    if statistic_threshold_type == 'iqr_norm':
+                        row_is_better = row_statistic < col_statistic
+                    else:
+                        row_is_better = row_statistic > col_statistic
+                    if row_is_better:
+                        selection_list.remove(cols[col])
+                    else:
+                        selection_list.remove(idx[row])
+    return selection_list, cost_distance_list
+
+
+def random_case(rng):
+    """Boxplot statistics and a correlation matrix of a random set of variables, some of them cost distances"""
+
+    n = rng.integers(2, 25)
+    names = ['c_' + str(i) if rng.random() < 0.15 else 't_' + str(i) for i in range(n)]
+    if rng.random() < 0.2:
+        names[0] = 'c_slop+asp'
+    # correlated site values give a realistic correlation matrix
+    values = rng.normal(size=(40, n)) + rng.normal(size=(40, 1)) * rng.uniform(0, 3)
+    correlation_matrix = pd.DataFrame(values, columns=names).corr('pearson')
+    # distinct statistics, the sort of the first version is not stable
+    df_boxplot_statistics = pd.DataFrame([rng.permutation(n) / float(n) + 0.01, rng.permutation(n) + 1.0],
+                                         index=['iqr_norm', 'w2'], columns=names)
+    return df_boxplot_statistics, correlation_matrix
+
+
+def test_select_predictors_matches_old_loop():
+    rng = np.random.default_rng(0)
+    for case in range(300):
+        df_boxplot_statistics, correlation_matrix = random_case(rng)
+        for statistic_threshold_type in ['iqr_norm', 'w2']:
+            statistic_threshold = int(rng.integers(1, 20))
+            corr_threshold = float(rng.choice([0.3, 0.5, 0.7, 1]))
+            expected = reference_selection(df_boxplot_statistics, correlation_matrix, statistic_threshold,
+                                           corr_threshold, statistic_threshold_type)
+            assert select_predictors(df_boxplot_statistics, correlation_matrix, statistic_threshold,
+                                     corr_threshold, statistic_threshold_type) == expected
+
+
+def test_select_predictors_grid_matches_single_selections():
+    rng = np.random.default_rng(1)
+    df_boxplot_statistics, correlation_matrix = random_case(rng)
+    selections = select_predictors_grid(df_boxplot_statistics, correlation_matrix, [1, 3, 100], [0.4, 1],
+                                        ['iqr_norm', 'w2'])
+    for (statistic_threshold, corr_threshold, statistic_threshold_type), selection in selections.items():
+        assert selection == reference_selection(df_boxplot_statistics, correlation_matrix, statistic_threshold,
+                                                corr_threshold, statistic_threshold_type)
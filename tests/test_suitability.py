@@ -0,0 +1,87 @@
+"""
+test_suitability.py<br>
+python 3.6.7<br>
+Regression tests of the weighted sum of the classes against a plain NumPy calculation on whole arrays<br>
+@author: Lisa Stubert<br>
+@date: 2019-05-30<br>
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+import rasterio
+
+from conftest import NODATA, PIXEL_SIZE, random_values
+from modules.reclassify_rasters import class_thresholds, reclassify_block
+from modules.suitability import suitability, weighted_sum
+from test_reclassify_rasters import reference_classes
+
+ITEMS = ['t_slope', 't_wind', 'c_coast']
+
+
+def model_inputs(tmp_path, write_raster):
+    """Working directory with three synthetic rasters, their boxplot statistics and the factors of two weightings"""
+
+    (tmp_path / 'data').mkdir()
+    raster_data = {}
+    statistics = {}
+    for seed, item in enumerate(ITEMS):
+        values = random_values(seed)
+        raster_data[item] = {'path': item + '.tif'}
+        write_raster('data/' + item + '.tif', values)
+        valid = values[values != NODATA]
+        percentiles = np.percentile(valid[::7], [12.5, 25, 50, 75, 87.5])
+        statistics[item] = dict(zip(['lower_percentile12.5', 'lower_quartile25', 'median', 'upper_quartile75',
+                                     'upper_percentile87.5'], percentiles))
+    weights = {'w1': {'t_slope': 0.7, 't_wind': 0.2, 'c_coast': 0.9}, 'w2': {'t_slope': 1.5, 't_wind': 2.5, 'c_coast': 1.0}}
+    return str(tmp_path) + '/', raster_data, pd.DataFrame(statistics), weights
+
+
+def reference_suitability(working_dir, raster_data, df_boxplot_statistics, weights, factor):
+    """Reclassify whole arrays, weight and add them up, normalize and take every factor-th pixel"""
+
+    results = {}
+    for weighting in weights:
+        suitability_sum = 0
+        for item in raster_data:
+            with rasterio.open(working_dir + 'data/' + raster_data[item]['path']) as src:
+                values = src.read(1).astype(float)
+            classes = reference_classes(item, values, df_boxplot_statistics[item])
+            suitability_sum = suitability_sum + weights[weighting][item] * np.where(values == NODATA, np.nan, classes)
+        suitability_sum = suitability_sum / np.nanmax(suitability_sum)
+        # nearest neighbour: the center of the resampled pixel i lies in the pixel factor * i + factor // 2
+        height = int(round(suitability_sum.shape[0] / float(factor)))
+        width = int(round(suitability_sum.shape[1] / float(factor)))
+        results[weighting] = suitability_sum[factor // 2::factor, factor // 2::factor][:height, :width]
+    return results
+
+
+@pytest.mark.parametrize('threads', [1, 4])
+@pytest.mark.parametrize('factor', [1, 3])
+def test_suitability_matches_numpy(tmp_path, write_raster, threads, factor):
+    working_dir, raster_data, df_boxplot_statistics, weights = model_inputs(tmp_path, write_raster)
+    results, transform, crs = suitability(working_dir, raster_data, df_boxplot_statistics, weights,
+                                          PIXEL_SIZE * factor, threads)
+    expected = reference_suitability(working_dir, raster_data, df_boxplot_statistics, weights, factor)
+    for weighting in weights:
+        np.testing.assert_allclose(np.asarray(results[weighting]), expected[weighting], rtol=1e-12)
+    assert transform.a == PIXEL_SIZE * factor
+
+
+@pytest.mark.parametrize('threads', [1, 4])
+def test_weighted_sum_of_class_rasters(tmp_path, write_raster, threads):
+    working_dir, raster_data, df_boxplot_statistics, weights = model_inputs(tmp_path, write_raster)
+    # the classes are calculated beforehand, like the class rasters of reclassify_rasters
+    paths = []
+    for item in ITEMS:
+        with rasterio.open(working_dir + 'data/' + raster_data[item]['path']) as src:
+            values = src.read(1, masked=True)
+        thresholds, lookup = class_thresholds(item, df_boxplot_statistics[item])
+        classes = reclassify_block(values, thresholds, lookup).astype(np.float32)
+        classes[np.ma.getmaskarray(values)] = NODATA
+        paths.append(write_raster('class_' + item + '.tif', classes))
+    results, transform, crs = weighted_sum(ITEMS, paths, [None] * len(ITEMS), [None] * len(ITEMS), weights,
+                                           PIXEL_SIZE, threads, read_ahead=1)
+    expected = reference_suitability(working_dir, raster_data, df_boxplot_statistics, weights, 1)
+    for weighting in weights:
+        np.testing.assert_allclose(np.asarray(results[weighting]), expected[weighting], rtol=1e-12)
@@ -0,0 +1,61 @@
+"""
+test_zonal_statistics.py<br>
+python 3.6.7<br>
+Regression tests of the zonal statistics against a loop over rasterio.mask, like the first version of average_raster_values<br>
+@author: Lisa Stubert<br>
+@date: 2019-05-30<br>
+"""
+
+import numpy as np
+import rasterio
+from rasterio.mask import mask
+from shapely.geometry import Point, box, mapping
+
+from conftest import NODATA, ORIGIN_X, ORIGIN_Y, PIXEL_SIZE, random_values
+from modules.zonal_statistics import zonal_statistics
+
+
+def reference_means(raster_path, geometries):
+    """Mean of the valid pixels that touch every polygon, one rasterio.mask call per polygon"""
+
+    means = []
+    with rasterio.open(raster_path) as src:
+        for geometry in geometries:
+            out_image, out_transform = mask(src, [mapping(geometry)], crop=True, all_touched=True)
+            data = out_image[0]
+            value = np.extract(data != src.nodata, data)
+            means.append(value.astype(float).mean() if len(value) > 0 else np.nan)
+    return np.array(means)
+
+
+def random_geometries(seed, n=120):
+    """Circles and rectangles inside the synthetic raster, many of them overlapping"""
+
+    rng = np.random.default_rng(seed)
+    geometries = []
+    for i in range(n):
+        x = ORIGIN_X + rng.uniform(60, 640)
+        y = ORIGIN_Y - rng.uniform(60, 540)
+        if i % 3 == 0:
+            geometries.append(box(x - rng.uniform(3, 40), y - rng.uniform(3, 40), x + rng.uniform(3, 40), y + rng.uniform(3, 40)))
+        else:
+            geometries.append(Point(x, y).buffer(rng.uniform(4, 50)))
+    return geometries
+
+
+def test_zonal_statistics_matches_mask_loop(write_raster):
+    for seed in range(3):
+        path = write_raster('values' + str(seed) + '.tif', random_values(seed))
+        geometries = random_geometries(seed)
+        result = zonal_statistics(path, geometries)
+        np.testing.assert_allclose(result['mean'].values, reference_means(path, geometries), rtol=1e-9)
+
+
+def test_zonal_statistics_without_valid_pixels(write_raster):
+    values = random_values(0)
+    values[20:30, 20:30] = NODATA
+    path = write_raster('values.tif', values)
+    center = Point(ORIGIN_X + 25 * PIXEL_SIZE, ORIGIN_Y - 25 * PIXEL_SIZE)
+    result = zonal_statistics(path, [center.buffer(12), center.buffer(80)])
+    assert np.isnan(result['mean'][0]) and result['count'][0] == 0
+    np.testing.assert_allclose(result['mean'][1], reference_means(path, [center.buffer(80)])[0], rtol=1e-9)